@@ -0,0 +1,93 @@
+"""
+Benchmark: text normalization over a synthetic 1,000-page manual.
+
+Compares the original six-`re.sub` clean_text with the precompiled version
+in server.helper.clean, single-threaded and via clean_many on a process pool,
+and checks that all outputs are byte-identical.
+
+    python benchmarks/bench_clean.py --pages 1000
+"""
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from server.helper.clean import clean_text, clean_many
+from server.worker_pool import WorkerPool
+
+def reference_clean_text(text):
+    # clean_text as it was before precompilation, kept here for parity checks
+    text = re.sub(r"^\s*\d+\s*[/of]\s*\d+\s*$", "", text, flags=re.IGNORECASE | re.MULTILINE)
+    text = re.sub(r"^\s*\d+\s*[—-]\s*\d+\s*$", "", text, flags=re.MULTILINE)
+    text = re.sub(r"^\s*\d+\s*$", "", text, flags=re.MULTILINE)
+    text = re.sub(r"^\s*(Figure|Page|Table)\s*\d+\s*$", "", text, flags=re.MULTILINE)
+    text = re.sub(r"[^\w\s]", " ", text)
+    text = re.sub(r"\s+", " ", text).strip()
+    return text
+
+WORDS = ("motor encoder feedback torque voltage current controller firmware parameter "
+         "register setpoint velocity position limit fault brake supply cable connector").split()
+
+def make_page(rng, page_num, num_pages):
+    lines = [f"{page_num} of {num_pages}", f"Section {rng.randint(1, 20)}.{rng.randint(1, 9)}"]
+    for _ in range(rng.randint(35, 55)):
+        words = [rng.choice(WORDS) for _ in range(rng.randint(6, 14))]
+        if rng.random() < 0.3:
+            words.append(f"({rng.randint(0, 999)} mA, ±{rng.randint(1, 50)}%)")
+        lines.append(" ".join(words) + rng.choice([".", ";", ":", "", "!"]))
+        if rng.random() < 0.05:
+            lines.append(f"Figure {rng.randint(1, 200)}")
+        if rng.random() < 0.03:
+            lines.append(f"Table {rng.randint(1, 80)}")
+    lines.append(str(page_num))
+    return "\n".join(lines)
+
+def timed(fn, *args, repeat=3):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(*args)
+        samples.append(time.perf_counter() - start)
+    return min(samples), result
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--pages', type=int, default=1000)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 2)
+    parser.add_argument('--output', help='write results as JSON to this file')
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    pages = [make_page(rng, i + 1, args.pages) for i in range(args.pages)]
+
+    reference_seconds, expected = timed(lambda: [reference_clean_text(page) for page in pages])
+    compiled_seconds, compiled = timed(lambda: [clean_text(page) for page in pages])
+    pool = WorkerPool(kind='process', max_workers=args.workers, max_queue=1024)
+    clean_many(pages, pool=pool)  # start the worker processes outside the timing
+    parallel_seconds, parallel = timed(clean_many, pages, pool)
+    pool.shutdown()
+
+    assert compiled == expected, "clean_text output differs from the reference"
+    assert parallel == expected, "clean_many output differs from the reference"
+
+    results = {
+        'pages': args.pages,
+        'megabytes': sum(len(page) for page in pages) / 1e6,
+        'reference_ms': reference_seconds * 1000,
+        'clean_text_ms': compiled_seconds * 1000,
+        'clean_many_ms': parallel_seconds * 1000,
+        'workers': args.workers,
+        'clean_text_speedup': reference_seconds / compiled_seconds,
+        'clean_many_speedup': reference_seconds / parallel_seconds,
+    }
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+"""
+Benchmark: deleting one document's chunks from the documents collection.
+
+Compares the old full-collection scan (get() everything, filter in Python)
+with the filtered metadata query used by AIAgent.delete_many_from_chroma,
+then times the agent's own delete paths on the same collection: one document
+through delete_many_from_chroma, and a batch through delete_documents (what
+POST /delete/bulk runs, catalog updates included).
+
+    python benchmarks/bench_delete.py --chunks 100000 --documents 500
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import chromadb
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from bench_server import FakeEmbeddings
+
+def build_collection(path, num_chunks, num_documents, dim):
+    client = chromadb.PersistentClient(path=path)
+    collection = client.get_or_create_collection('documents')
+    rng = random.Random(0)
+    batch_size = client.get_max_batch_size()
+    for start in range(0, num_chunks, batch_size):
+        end = min(start + batch_size, num_chunks)
+        collection.add(
+            ids=[f"chunk-{i}" for i in range(start, end)],
+            embeddings=[[rng.random() for _ in range(dim)] for _ in range(start, end)],
+            metadatas=[{"source": f"./public/doc-{i % num_documents}.pdf", "page": i // num_documents}
+                       for i in range(start, end)],
+        )
+    return collection
+
+def scan_ids(collection, source):
+    coll = collection.get(include=['metadatas'])
+    return [chunk_id for chunk_id, metadata in zip(coll['ids'], coll['metadatas'])
+            if metadata.get('source') == source]
+
+def filtered_ids(collection, source):
+    return collection.get(where={"source": source}, include=[])['ids']
+
+def timed(fn, *args, repeat=5):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(*args)
+        samples.append(time.perf_counter() - start)
+    return min(samples), result
+
+def make_agent(path, num_documents, dim):
+    # The agent opens ./chroma and ./catalog.sqlite3 relative to the working directory
+    from server.ai_agent import AIAgent
+
+    os.chdir(path)
+    agent = AIAgent('gemini', embeddings=FakeEmbeddings(dim), embedding_model=f'fake-{dim}',
+                    chat_model=lambda: None)
+    with agent.catalog.transaction():
+        for i in range(num_documents):
+            agent.catalog.upsert(f"doc-{i}.pdf", f"./public/doc-{i}.pdf", status='done')
+    return agent
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--chunks', type=int, default=100_000)
+    parser.add_argument('--documents', type=int, default=500)
+    parser.add_argument('--dim', type=int, default=16)
+    parser.add_argument('--output', help='write results as JSON to this file')
+
+    parser.add_argument('--bulk', type=int, default=10, help='documents per delete_documents call')
+    args = parser.parse_args()
+
+    path = tempfile.mkdtemp(prefix='bench_delete_')
+    cwd = os.getcwd()
+    try:
+        start = time.perf_counter()
+        collection = build_collection(os.path.join(path, 'chroma'), args.chunks, args.documents, args.dim)
+        build_seconds = time.perf_counter() - start
+
+        source = "./public/doc-7.pdf"
+        scan_seconds, scanned = timed(scan_ids, collection, source)
+        filter_seconds, filtered = timed(filtered_ids, collection, source)
+        assert sorted(scanned) == sorted(filtered)
+
+        start = time.perf_counter()
+        collection.delete(ids=filtered)
+        delete_seconds = time.perf_counter() - start
+
+        results = {
+            'chunks': args.chunks,
+            'documents': args.documents,
+            'chunks_per_document': len(filtered),
+            'build_seconds': build_seconds,
+            'lookup_full_scan_ms': scan_seconds * 1000,
+            'lookup_filtered_ms': filter_seconds * 1000,
+            'lookup_speedup': scan_seconds / filter_seconds if filter_seconds else None,
+            'delete_ms': delete_seconds * 1000,
+        }
+
+        agent = make_agent(path, args.documents, args.dim)
+        # Each document can only be deleted once, so every sample uses the next ones
+        single = []
+        for i in range(10, 15):
+            start = time.perf_counter()
+            agent.delete_many_from_chroma([f"./public/doc-{i}.pdf"])
+            single.append(time.perf_counter() - start)
+        bulk = []
+        for first in range(20, 20 + 5 * args.bulk, args.bulk):
+            names = [f"doc-{i}.pdf" for i in range(first, first + args.bulk)]
+            start = time.perf_counter()
+            removed, deleted = agent.delete_documents(names)
+            bulk.append(time.perf_counter() - start)
+            assert len(removed) == len(names) and deleted == len(names) * len(filtered)
+        results['agent_delete_one_ms'] = statistics.median(single) * 1000
+        results['agent_delete_bulk_documents'] = args.bulk
+        results['agent_delete_bulk_ms'] = statistics.median(bulk) * 1000
+        print(json.dumps(results, indent=2))
+        if args.output:
+            with open(args.output, 'w') as f:
+                json.dump(results, f, indent=2)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(path, ignore_errors=True)
+
+if __name__ == '__main__':
+    main()
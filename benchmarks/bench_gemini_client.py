@@ -0,0 +1,229 @@
+"""
+Benchmark: GeminiClient against a local fake HTTP stand-in for the Gemini API.
+
+The stand-in answers POST /generate (and /stream, line by line) after a
+latency drawn from a long-tailed distribution, and fails a configurable share
+of requests with 503. The client is run under several policies so the effect
+of retries, hedging and the circuit breaker on success rate and tail latency
+can be compared; a final phase takes the stand-in down entirely to show the
+breaker failing fast.
+
+    python benchmarks/bench_gemini_client.py --requests 400 --concurrency 8 --error-rate 0.05
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import socket
+import sys
+import threading
+import time
+import httpx
+import uvicorn
+from fastapi import FastAPI, Response
+from fastapi.responses import StreamingResponse
+from langchain_core.messages import AIMessage, AIMessageChunk
+from pydantic import BaseModel
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from server.gemini_client import GeminiClient, CircuitBreaker, CircuitOpenError, GeminiTimeoutError
+
+class FakeGemini:
+    """
+    Behaviour of the stand-in, changeable while it runs.
+    """
+    def __init__(self, latency_ms, slow_ms, slow_rate, error_rate, seed=0):
+        self.latency_ms = latency_ms
+        self.slow_ms = slow_ms
+        self.slow_rate = slow_rate
+        self.error_rate = error_rate
+        self.down = False
+        self.requests = 0
+        self.rng = random.Random(seed)
+
+    def delay(self):
+        if self.rng.random() < self.slow_rate:
+            return self.slow_ms / 1000
+        return self.rng.lognormvariate(math.log(self.latency_ms), 0.25) / 1000
+
+def fake_gemini_app(fake):
+    app = FastAPI()
+
+    class GenerateRequest(BaseModel):
+        prompt: str
+
+    @app.post("/generate")
+    async def generate(request: GenerateRequest, response: Response):
+        fake.requests += 1
+        if fake.down or fake.rng.random() < fake.error_rate:
+            response.status_code = 503
+            return {"error": "unavailable"}
+        await asyncio.sleep(fake.delay())
+        return {"text": f"answer to: {request.prompt[:40]}"}
+
+    @app.post("/stream")
+    async def stream(request: GenerateRequest, response: Response):
+        fake.requests += 1
+        if fake.down or fake.rng.random() < fake.error_rate:
+            response.status_code = 503
+            return {"error": "unavailable"}
+
+        async def lines():
+            await asyncio.sleep(fake.delay())
+            for word in f"answer to: {request.prompt[:40]}".split():
+                yield word + "\n"
+                await asyncio.sleep(0.002)
+        return StreamingResponse(lines(), media_type="text/plain")
+
+    return app
+
+class HttpChatModel:
+    """
+    Chat model with ainvoke()/astream() over a pooled httpx client, standing in
+    for ChatGoogleGenerativeAI. The client is created on first use, i.e. on the
+    GeminiClient's event loop.
+    """
+    def __init__(self, base_url, max_connections=64):
+        self.base_url = base_url
+        self.max_connections = max_connections
+        self._client = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = httpx.AsyncClient(base_url=self.base_url, timeout=None,
+                                             limits=httpx.Limits(max_connections=self.max_connections))
+        return self._client
+
+    async def ainvoke(self, prompt):
+        response = await self.client.post('/generate', json={'prompt': prompt})
+        response.raise_for_status()
+        return AIMessage(content=response.json()['text'])
+
+    async def astream(self, prompt):
+        async with self.client.stream('POST', '/stream', json={'prompt': prompt}) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                yield AIMessageChunk(content=line + " ")
+
+def percentile(samples, q):
+    ordered = sorted(samples)
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)] if ordered else None
+
+def summarize(samples):
+    if not samples:
+        return {'count': 0}
+    return {
+        'count': len(samples),
+        'p50_ms': percentile(samples, 50) * 1000,
+        'p95_ms': percentile(samples, 95) * 1000,
+        'p99_ms': percentile(samples, 99) * 1000,
+        'max_ms': max(samples) * 1000,
+    }
+
+async def drive(client, requests, concurrency, stream=False):
+    latencies = []
+    failed_latencies = []
+    outcomes = {}
+    gate = asyncio.Semaphore(concurrency)
+
+    async def one(i):
+        async with gate:
+            start = time.perf_counter()
+            try:
+                if stream:
+                    async for _ in client.astream(f"question {i}"):
+                        pass
+                else:
+                    await client.ainvoke(f"question {i}")
+                outcome = 'ok'
+            except CircuitOpenError:
+                outcome = 'circuit_open'
+            except GeminiTimeoutError:
+                outcome = 'timeout'
+            except Exception as e:
+                outcome = type(e).__name__
+            elapsed = time.perf_counter() - start
+            outcomes[outcome] = outcomes.get(outcome, 0) + 1
+            (latencies if outcome == 'ok' else failed_latencies).append(elapsed)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    seconds = time.perf_counter() - start
+    return {
+        'requests': requests,
+        'seconds': seconds,
+        'requests_per_s': requests / seconds,
+        'success_rate': outcomes.get('ok', 0) / requests,
+        'outcomes': outcomes,
+        'latency': summarize(latencies),
+        'failed_latency': summarize(failed_latencies),
+    }
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=400)
+    # Below the client's limit, so hedges have spare slots to run in
+    parser.add_argument('--concurrency', type=int, default=8, help='callers issuing requests at once')
+    parser.add_argument('--max-concurrency', type=int, default=16, help='GeminiClient in-flight limit')
+    parser.add_argument('--latency-ms', type=float, default=80.0)
+    parser.add_argument('--slow-ms', type=float, default=1500.0, help='latency of the slow tail')
+    parser.add_argument('--slow-rate', type=float, default=0.03)
+    parser.add_argument('--error-rate', type=float, default=0.05, help='share of requests failing with 503')
+    parser.add_argument('--deadline', type=float, default=5.0)
+    parser.add_argument('--hedge-after', type=float, default=0.25)
+    parser.add_argument('--output', help='write results as JSON to this file')
+    args = parser.parse_args()
+
+    fake = FakeGemini(args.latency_ms, args.slow_ms, args.slow_rate, args.error_rate)
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(fake_gemini_app(fake), host='127.0.0.1', port=port,
+                                           log_level='warning', access_log=False))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    base_url = f'http://127.0.0.1:{port}'
+
+    policies = {
+        'no_retries': dict(retries=0, hedge_after=None),
+        'retries': dict(retries=2, hedge_after=None),
+        'retries_hedged': dict(retries=2, hedge_after=args.hedge_after),
+    }
+    results = {'config': {key: value for key, value in vars(args).items() if key != 'output'}}
+    for name, policy in policies.items():
+        client = GeminiClient(HttpChatModel(base_url), max_concurrency=args.max_concurrency,
+                              deadline=args.deadline, breaker=CircuitBreaker(failure_threshold=1000), **policy)
+        results[name] = asyncio.run(drive(client, args.requests, args.concurrency))
+        results[name]['client'] = client.stats()
+        client.close()
+
+    client = GeminiClient(HttpChatModel(base_url), max_concurrency=args.max_concurrency, deadline=args.deadline,
+                          retries=2, hedge_after=args.hedge_after, breaker=CircuitBreaker(failure_threshold=1000))
+    results['streaming'] = asyncio.run(drive(client, args.requests, args.concurrency, stream=True))
+    results['streaming']['client'] = client.stats()
+    client.close()
+
+    # Outage: every call fails; the breaker should open and later calls fail without reaching the API
+    fake.down = True
+    before = fake.requests
+    client = GeminiClient(HttpChatModel(base_url), max_concurrency=args.max_concurrency, deadline=args.deadline,
+                          retries=2, breaker=CircuitBreaker(failure_threshold=5, cooldown=30))
+    results['outage'] = asyncio.run(drive(client, args.requests, args.concurrency))
+    results['outage']['client'] = client.stats()
+    results['outage']['upstream_requests'] = fake.requests - before
+    client.close()
+
+    server.should_exit = True
+    thread.join()
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""
+Benchmark: per-query retrieval latency against the persistent documents collection.
+
+Compares the original query path, which opened a new Chroma(...) client and
+retriever for every question, with the long-lived handle from
+server.vector_store.CollectionRegistry. Embeddings are the offline
+feature-hashing stand-in from bench_server, so only Chroma is measured.
+
+    python benchmarks/bench_retrieval.py --chunks 20000 --queries 200
+"""
+import argparse
+import json
+import math
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from langchain_core.documents import Document
+from bench_server import FakeEmbeddings
+from server.vector_store import CollectionRegistry
+
+WORDS = ("motor encoder feedback torque voltage current controller firmware parameter "
+         "register setpoint velocity position limit fault brake supply cable connector").split()
+
+def percentile(samples, q):
+    ordered = sorted(samples)
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+def summarize(samples):
+    return {
+        'mean_ms': sum(samples) / len(samples) * 1000,
+        'p50_ms': percentile(samples, 50) * 1000,
+        'p95_ms': percentile(samples, 95) * 1000,
+    }
+
+def fresh_client(embeddings, path, question):
+    # The query path before CollectionRegistry
+    from langchain_community.vectorstores import Chroma
+
+    db = Chroma(collection_name='documents', embedding_function=embeddings, persist_directory=path)
+    return db.as_retriever().invoke(question)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--chunks', type=int, default=20000)
+    parser.add_argument('--documents', type=int, default=100)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--dim', type=int, default=256)
+    parser.add_argument('--output', help='write results as JSON to this file')
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    embeddings = FakeEmbeddings(args.dim)
+    path = tempfile.mkdtemp(prefix='bench_retrieval_')
+    try:
+        registry = CollectionRegistry(embeddings, path)
+        db = registry.get('documents')
+        chunks = [
+            Document(page_content=" ".join(rng.choice(WORDS) for _ in range(40)),
+                     metadata={'source': f'./public/doc-{i % args.documents}.pdf', 'page': i // args.documents})
+            for i in range(args.chunks)
+        ]
+        start = time.perf_counter()
+        batch_size = db._client.get_max_batch_size()
+        for i in range(0, len(chunks), batch_size):
+            batch = chunks[i:i + batch_size]
+            db.add_documents(batch, ids=[f'chunk-{i + j}' for j in range(len(batch))])
+        build_seconds = time.perf_counter() - start
+
+        questions = [" ".join(rng.choice(WORDS) for _ in range(6)) + "?" for _ in range(args.queries)]
+        retriever = registry.retriever('documents')
+        # Warm-up, so neither side pays for first-touch costs
+        retriever.invoke(questions[0])
+        fresh_client(embeddings, path, questions[0])
+
+        results = {'chunks': args.chunks, 'queries': args.queries, 'build_seconds': build_seconds}
+        for name, query in (('fresh_client', lambda q: fresh_client(embeddings, path, q)),
+                            ('shared_handle', retriever.invoke)):
+            samples = []
+            for question in questions:
+                start = time.perf_counter()
+                found = query(question)
+                samples.append(time.perf_counter() - start)
+                assert len(found) == 4
+            results[name] = summarize(samples)
+        results['speedup_p50'] = results['fresh_client']['p50_ms'] / results['shared_handle']['p50_ms']
+        print(json.dumps(results, indent=2))
+        if args.output:
+            with open(args.output, 'w') as f:
+                json.dump(results, f, indent=2)
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,475 @@
+"""
+Benchmark: the whole server, end to end and offline.
+
+Runs server.app in-process under uvicorn with a deterministic hashing embedder
+in place of GoogleGenerativeAIEmbeddings and a fake chat model with configurable
+latency in place of ChatGoogleGenerativeAI, then drives it over HTTP and the
+WebSocket like the Godot client does:
+
+  * ingestion: uploads generated text PDFs and reports pages/s, chunks/s and
+    per-stage timings from /jobs/{id}
+  * query: one client asking questions in turn, with p50/p95/p99 per stage
+    (route, retrieve, context, generate) and end to end
+  * websocket: many clients chatting at once, messages/s and latency
+
+Chroma and the caches live in a temporary directory; uploaded PDFs are removed
+again through /delete/bulk. Results are JSON, so runs from two commits can be
+compared:
+
+    python benchmarks/bench_server.py --documents 10 --pages 20 --output before.json
+    python benchmarks/bench_server.py --documents 10 --pages 20 --compare before.json
+    python benchmarks/bench_server.py --compare before.json after.json
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+import uuid
+import zlib
+import httpx
+import uvicorn
+from langchain_core.embeddings import Embeddings
+from langchain_core.messages import AIMessage, AIMessageChunk
+from websockets.asyncio.client import connect
+
+PROJECT_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+class FakeEmbeddings(Embeddings):
+    """
+    Deterministic bag-of-words embeddings (feature hashing), so texts that share
+    words land close together and retrieval still returns sensible chunks.
+    """
+    def __init__(self, dim=256, latency_ms=0.0, per_text_ms=0.0):
+        self.dim = dim
+        self.latency_ms = latency_ms
+        self.per_text_ms = per_text_ms
+
+    def _vector(self, text):
+        vector = [0.0] * self.dim
+        for word in text.lower().split():
+            digest = zlib.crc32(word.encode('utf-8'))
+            vector[digest % self.dim] += 1.0 if digest & 0x80000000 else -1.0
+        norm = math.sqrt(sum(x * x for x in vector)) or 1.0
+        return [x / norm for x in vector]
+
+    def _wait(self, count):
+        delay = self.latency_ms + self.per_text_ms * count
+        if delay:
+            time.sleep(delay / 1000)
+
+    def embed_documents(self, texts):
+        self._wait(len(texts))
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text):
+        self._wait(1)
+        return self._vector(text)
+
+class FakeChatModel:
+    """
+    Stands in for ChatGoogleGenerativeAI: (a)invoke() and (a)stream() with a fixed time
+    to first token and a per-token delay.
+    """
+    def __init__(self, first_token_ms=300.0, token_ms=15.0, answer_tokens=40):
+        self.first_token_ms = first_token_ms
+        self.token_ms = token_ms
+        self.answer_tokens = answer_tokens
+
+    def _tokens(self, prompt):
+        if 'decision-making agent' in prompt:
+            return ['answer']
+        rng = random.Random(zlib.crc32(prompt.encode('utf-8')))
+        return [rng.choice(WORDS) for _ in range(self.answer_tokens)]
+
+    def invoke(self, prompt):
+        tokens = self._tokens(prompt)
+        time.sleep((self.first_token_ms + self.token_ms * len(tokens)) / 1000)
+        return AIMessage(content=" ".join(tokens))
+
+    def stream(self, prompt):
+        time.sleep(self.first_token_ms / 1000)
+        for i, token in enumerate(self._tokens(prompt)):
+            if i:
+                time.sleep(self.token_ms / 1000)
+            yield AIMessageChunk(content=token + " ")
+
+    async def ainvoke(self, prompt):
+        tokens = self._tokens(prompt)
+        await asyncio.sleep((self.first_token_ms + self.token_ms * len(tokens)) / 1000)
+        return AIMessage(content=" ".join(tokens))
+
+    async def astream(self, prompt):
+        await asyncio.sleep(self.first_token_ms / 1000)
+        for i, token in enumerate(self._tokens(prompt)):
+            if i:
+                await asyncio.sleep(self.token_ms / 1000)
+            yield AIMessageChunk(content=token + " ")
+
+def make_words(count=600, seed=0):
+    rng = random.Random(seed)
+    syllables = ['ka', 'lo', 'mi', 're', 'tan', 'vu', 'pe', 'dor', 'si', 'qua', 'nel', 'bri', 'ox', 'fen', 'gal']
+    words = set()
+    while len(words) < count:
+        words.add("".join(rng.choice(syllables) for _ in range(rng.randint(2, 4))))
+    return sorted(words)
+
+WORDS = make_words()
+
+def make_page_lines(rng, lines=45, width=90):
+    page = []
+    for _ in range(lines):
+        line = []
+        while sum(len(word) + 1 for word in line) < width:
+            line.append(rng.choice(WORDS))
+        page.append(" ".join(line))
+    return page
+
+def make_pdf(pages):
+    """
+    Writes a minimal PDF with one Helvetica text line per entry of each page.
+    """
+    def escape(text):
+        return text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None,
+               b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for lines in pages:
+        stream = "BT /F1 9 Tf 11 TL 40 800 Td " + " ".join(f"({escape(line)}) Tj T*" for line in lines) + " ET"
+        stream = stream.encode('latin-1')
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+        content_ref = len(objects)
+        objects.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+                       b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_ref)
+        kids.append(b"%d 0 R" % len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (b" ".join(kids), len(kids))
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        out += b"%010d 00000 n \n" % offset
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return bytes(out)
+
+def percentile(samples, q):
+    ordered = sorted(samples)
+    rank = max(0, math.ceil(q / 100 * len(ordered)) - 1)
+    return ordered[rank]
+
+def summarize(samples):
+    if not samples:
+        return {'count': 0}
+    return {
+        'count': len(samples),
+        'mean_ms': sum(samples) / len(samples) * 1000,
+        'p50_ms': percentile(samples, 50) * 1000,
+        'p95_ms': percentile(samples, 95) * 1000,
+        'p99_ms': percentile(samples, 99) * 1000,
+    }
+
+class StageTimer:
+    """
+    Records how long wrapped calls take, per stage name.
+    """
+    def __init__(self):
+        self.samples = {}
+        self._lock = threading.Lock()
+
+    def wrap(self, name, fn):
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                with self._lock:
+                    self.samples.setdefault(name, []).append(time.perf_counter() - start)
+        return timed
+
+    def wrap_async(self, name, fn):
+        async def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await fn(*args, **kwargs)
+            finally:
+                with self._lock:
+                    self.samples.setdefault(name, []).append(time.perf_counter() - start)
+        return timed
+
+    def reset(self):
+        with self._lock:
+            self.samples = {}
+
+    def summary(self):
+        with self._lock:
+            return {name: summarize(samples) for name, samples in self.samples.items()}
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def question(rng, i):
+    return f"What does section {i} say about {rng.choice(WORDS)} {rng.choice(WORDS)}?"
+
+async def wait_ready(client, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        response = await client.get('/ready')
+        if response.status_code == 200:
+            return
+        await asyncio.sleep(0.1)
+    raise RuntimeError(f"Server not ready after {timeout}s: {response.json()}")
+
+async def run_ingestion(client, names, documents):
+    started = time.time()
+    job_ids = []
+    for name, data in zip(names, documents):
+        response = await client.post('/upload', files={'file': (name, data, 'application/pdf')})
+        response.raise_for_status()
+        job_ids.append(response.json()['job_id'])
+
+    jobs = {}
+    while len(jobs) < len(job_ids):
+        for job_id in job_ids:
+            if job_id not in jobs:
+                job = (await client.get(f'/jobs/{job_id}')).json()
+                if job['status'] in ('done', 'failed'):
+                    jobs[job_id] = job
+        await asyncio.sleep(0.05)
+
+    finished = [job for job in jobs.values() if job['status'] == 'done']
+    seconds = max(job['finished_at'] for job in jobs.values()) - started
+    pages = sum(len(job['pages']) for job in finished)
+    chunks = sum(job['chunks'].get('added', 0) for job in finished)
+    stages = {}
+    for job in finished:
+        for stage, value in job['timings'].items():
+            stages.setdefault(stage, []).append(value)
+    return {
+        'documents': len(finished),
+        'failed': len(jobs) - len(finished),
+        'pages': pages,
+        'chunks': chunks,
+        'seconds': seconds,
+        'pages_per_s': pages / seconds,
+        'chunks_per_s': chunks / seconds,
+        'stages': {stage: summarize(values) for stage, values in stages.items()},
+        'page_extract': summarize([page['seconds'] for job in finished for page in job['pages']]),
+    }
+
+async def chat(websocket, text, stream=False):
+    """
+    Sends one chat message; returns (latency, time to first frame, response type).
+    """
+    start = time.perf_counter()
+    first = None
+    await websocket.send(json.dumps({'type': 'chat', 'content': text, 'stream': stream}))
+    while True:
+        frame = json.loads(await websocket.recv())
+        if first is None:
+            first = time.perf_counter() - start
+        if frame['type'] != 'answer_delta':
+            return time.perf_counter() - start, first, frame.get('code') or frame['type']
+
+async def run_queries(url, count, rng, offset, stream):
+    latencies = []
+    async with connect(url) as websocket:
+        for i in range(count):
+            latency, _, _ = await chat(websocket, question(rng, offset + i), stream)
+            latencies.append(latency)
+    return summarize(latencies)
+
+async def run_clients(url, clients, messages, rng, offset, stream):
+    questions = [[question(rng, offset + c * messages + m) for m in range(messages)] for c in range(clients)]
+    latencies = []
+    first_frames = []
+    outcomes = {}
+
+    async def client(texts):
+        async with connect(url) as websocket:
+            for text in texts:
+                latency, first, outcome = await chat(websocket, text, stream)
+                latencies.append(latency)
+                first_frames.append(first)
+                outcomes[outcome] = outcomes.get(outcome, 0) + 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client(texts) for texts in questions))
+    seconds = time.perf_counter() - start
+    return {
+        'clients': clients,
+        'messages': clients * messages,
+        'seconds': seconds,
+        'messages_per_s': clients * messages / seconds,
+        'outcomes': outcomes,
+        'latency': summarize(latencies),
+        'first_frame': summarize(first_frames),
+    }
+
+async def drive(base_url, args, timer):
+    rng = random.Random(args.seed)
+    run_id = uuid.uuid4().hex[:8]
+    names = [f"bench-{run_id}-{i}.pdf" for i in range(args.documents)]
+    documents = [make_pdf([make_page_lines(rng) for _ in range(args.pages)]) for _ in names]
+    ws_url = base_url.replace('http', 'ws', 1) + '/ws'
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=600) as client:
+        await wait_ready(client)
+        try:
+            ingestion = await run_ingestion(client, names, documents)
+            timer.reset()
+            query_latency = await run_queries(ws_url, args.queries, rng, 0, args.stream)
+            query = {'end_to_end': query_latency, 'stages': timer.summary()}
+            websocket = await run_clients(ws_url, args.clients, args.messages, rng, args.queries, args.stream)
+        finally:
+            await client.post('/delete/bulk', json={'document_names': names})
+    return {'ingestion': ingestion, 'query': query, 'websocket': websocket}
+
+def run(args):
+    workdir = tempfile.mkdtemp(prefix='bench-server-')
+    public = os.path.join(PROJECT_PATH, 'server', 'public')
+    os.makedirs(public, exist_ok=True)
+    # The server resolves ./public relative to its working directory; keep everything else temporary
+    os.symlink(public, os.path.join(workdir, 'public'))
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    os.environ.setdefault('GOOGLE_API_KEY', 'offline-benchmark')
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+    sys.path.insert(0, PROJECT_PATH)
+    try:
+        from server import app as server_app
+        from server.ai_agent import AIAgent
+        from server.ingestion import IngestionQueue
+
+        timer = StageTimer()
+
+        def chat_model():
+            model = FakeChatModel(args.first_token_ms, args.token_ms, args.answer_tokens)
+            model.invoke = timer.wrap('generate', model.invoke)
+            model.ainvoke = timer.wrap_async('generate', model.ainvoke)
+            return model
+
+        agent = AIAgent('gemini',
+                        embeddings=FakeEmbeddings(args.dim, args.embed_ms, args.embed_per_text_ms),
+                        embedding_model=f'fake-hash-{args.dim}',
+                        chat_model=chat_model)
+        agent.router.route = timer.wrap('route', agent.router.route)
+        agent.retrive_documents = timer.wrap('retrieve', agent.retrive_documents)
+        agent._build_context = timer.wrap('context', agent._build_context)
+        agent.agenerate_answer = timer.wrap_async('server_total', agent.agenerate_answer)
+        server_app.agent = agent
+        server_app.ingestion = IngestionQueue(agent, server_app.ingest_pool,
+                                              notify=server_app.notify_ingest_progress,
+                                              on_failure=server_app.remove_failed_upload)
+
+        port = free_port()
+        server = uvicorn.Server(uvicorn.Config(server_app.app, host='127.0.0.1', port=port, log_level='warning'))
+        thread = threading.Thread(target=server.run, daemon=True)
+        thread.start()
+        while not server.started:
+            time.sleep(0.05)
+        try:
+            results = asyncio.run(drive(f'http://127.0.0.1:{port}', args, timer))
+        finally:
+            server.should_exit = True
+            thread.join()
+            agent.extract_pool.shutdown()
+        results['config'] = {key: value for key, value in vars(args).items() if key not in ('output', 'compare')}
+        return results
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+def flatten(results, prefix=''):
+    flat = {}
+    for key, value in results.items():
+        if key == 'config':
+            continue
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, name + '.'))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+def compare(baseline, current, threshold):
+    """
+    Prints the change of every metric and returns the ones that regressed by
+    more than `threshold` percent. Rates (*_per_s) should go up, times should go down.
+    """
+    old, new = flatten(baseline), flatten(current)
+    regressions = []
+    for name in sorted(old.keys() & new.keys()):
+        if name.endswith('_per_s'):
+            higher_is_better = True
+        elif name.endswith('_ms') or name.endswith('seconds'):
+            higher_is_better = False
+        else:
+            continue
+        change = (new[name] - old[name]) / old[name] * 100 if old[name] else 0.0
+        regressed = (change < -threshold) if higher_is_better else (change > threshold)
+        # Sub-millisecond stages are mostly scheduling noise
+        if name.endswith('_ms') and abs(new[name] - old[name]) < 1.0:
+            regressed = False
+        if regressed:
+            regressions.append(name)
+        print(f"{name:50s} {old[name]:12.2f} {new[name]:12.2f} {change:+8.1f}%{'  REGRESSION' if regressed else ''}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--documents', type=int, default=5)
+    parser.add_argument('--pages', type=int, default=20)
+    parser.add_argument('--queries', type=int, default=50, help='sequential questions for the per-stage latency run')
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--messages', type=int, default=10, help='chat messages per concurrent client')
+    parser.add_argument('--stream', action='store_true', help='request streamed answers')
+    parser.add_argument('--dim', type=int, default=256)
+    parser.add_argument('--embed-ms', type=float, default=50.0, help='fake embedding latency per call')
+    parser.add_argument('--embed-per-text-ms', type=float, default=0.5)
+    parser.add_argument('--first-token-ms', type=float, default=300.0, help='fake chat model time to first token')
+    parser.add_argument('--token-ms', type=float, default=15.0)
+    parser.add_argument('--answer-tokens', type=int, default=40)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--threshold', type=float, default=10.0, help='regression threshold in percent')
+    parser.add_argument('--output', help='write results as JSON to this file')
+    parser.add_argument('--compare', nargs='+', metavar='RESULTS',
+                        help='baseline JSON to compare this run against, or two JSON files to compare without running')
+    args = parser.parse_args()
+
+    if args.compare and len(args.compare) == 2:
+        with open(args.compare[0]) as f:
+            baseline = json.load(f)
+        with open(args.compare[1]) as f:
+            results = json.load(f)
+    else:
+        results = run(args)
+        print(json.dumps(results, indent=2))
+        if args.output:
+            with open(args.output, 'w') as f:
+                json.dump(results, f, indent=2)
+        if not args.compare:
+            return
+        with open(args.compare[0]) as f:
+            baseline = json.load(f)
+
+    regressions = compare(baseline, results, args.threshold)
+    if regressions:
+        print(f"{len(regressions)} metric(s) regressed by more than {args.threshold}%")
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
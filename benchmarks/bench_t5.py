@@ -0,0 +1,184 @@
+"""
+Benchmark: local T5 inference profiles on a fixed question set.
+
+Runs every question through each profile (runtime, int8 quantization, thread
+budget, decoding preset) and reports tokenization and generation latency per
+question. Each profile's answers are compared against the baseline, which is
+the original setup: fp32 torch, the sentencepiece tokenizer, all cores and
+4-beam decoding. The fast_tokenizer profile changes only the tokenizer, so
+its parity shows whether T5_FAST_TOKENIZER=1 is safe to turn on.
+
+Needs torch and transformers. The onnx profiles also need
+optimum[onnxruntime] and are skipped without it.
+
+    python benchmarks/bench_t5.py --repeat 3
+    python benchmarks/bench_t5.py --profiles baseline int8_greedy --threads 4
+"""
+import argparse
+import importlib.util
+import json
+import math
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from server.model_registry import model_size_bytes
+from server.t5_runtime import T5Profile
+
+# Short manual excerpts, like the chunks retrieval hands to T5
+QUESTIONS = [
+    ("What voltage does the controller need?",
+     "The motor controller is powered from a 24 V DC supply. Inputs between 18 V and 30 V are accepted; "
+     "outside this range the controller raises an undervoltage or overvoltage fault and disables the output stage."),
+    ("How do I reset a fault?",
+     "Faults latch until they are cleared. To reset a fault, remove the cause, then toggle the enable input "
+     "off and on again or write 1 to the fault reset register. The status LED turns green when the fault is cleared."),
+    ("What does a blinking red LED mean?",
+     "A steady green LED means the drive is enabled. A blinking green LED means the drive is ready but disabled. "
+     "A blinking red LED indicates an encoder fault, and a steady red LED indicates an overcurrent fault."),
+    ("What is the maximum continuous current?",
+     "The drive delivers 8 A continuous and 20 A peak for up to two seconds. Above 40 degrees ambient "
+     "temperature the continuous current is derated by 2 percent per degree."),
+    ("Which cable connects the encoder?",
+     "The encoder is connected with the shielded 10-pin cable to connector X3. Connect the shield to the "
+     "connector housing on both ends. Do not route the encoder cable next to the motor power cable."),
+    ("How often should the brake be inspected?",
+     "Inspect the holding brake every 2000 operating hours or once a year, whichever comes first. "
+     "Replace the brake pads if the air gap exceeds 0.5 mm."),
+    ("What is the default baud rate?",
+     "The serial interface defaults to 115200 baud, 8 data bits, no parity and one stop bit. "
+     "The baud rate can be changed in parameter P2.10 and takes effect after a restart."),
+    ("Where is the emergency stop connected?",
+     "The emergency stop circuit is wired to the safe torque off inputs STO1 and STO2 on connector X5. "
+     "Both channels must be opened to remove torque from the motor."),
+    ("How do I set the velocity limit?",
+     "The velocity limit is set in parameter P4.02 in revolutions per minute. The default is 3000 rpm. "
+     "Values above the motor's rated speed are clipped to the rated speed."),
+    ("What happens when the motor overheats?",
+     "A thermistor in the motor winding is monitored continuously. When the winding exceeds 130 degrees the "
+     "drive reduces the current limit, and at 150 degrees it switches off with an overtemperature fault."),
+    ("Which firmware version added position mode?",
+     "Position mode was introduced in firmware version 2.4. Earlier versions only support velocity and torque "
+     "mode. Use the update tool to install the latest firmware over USB."),
+    ("How long does homing take?",
+     "Homing moves the axis at 50 mm/s until the reference switch is reached, then backs off slowly to find the "
+     "index pulse. On a 1 m axis the complete homing sequence takes about 25 seconds."),
+]
+
+PROFILES = {
+    'baseline': dict(runtime='torch', decoding='full_beam', fast_tokenizer=False, threads=os.cpu_count()),
+    'fast_tokenizer': dict(runtime='torch', decoding='full_beam', fast_tokenizer=True, threads=os.cpu_count()),
+    'budget_full_beam': dict(runtime='torch', decoding='full_beam'),
+    'budget_small_beam': dict(runtime='torch', decoding='small_beam'),
+    'budget_greedy': dict(runtime='torch', decoding='greedy'),
+    'int8_full_beam': dict(runtime='torch', quantize='int8', decoding='full_beam'),
+    'int8_small_beam': dict(runtime='torch', quantize='int8', decoding='small_beam'),
+    'int8_greedy': dict(runtime='torch', quantize='int8', decoding='greedy'),
+    'onnx_full_beam': dict(runtime='onnx', decoding='full_beam'),
+    'onnx_int8_greedy': dict(runtime='onnx', quantize='int8', decoding='greedy'),
+}
+
+def percentile(samples, q):
+    ordered = sorted(samples)
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)] if ordered else None
+
+def summarize(samples):
+    return {
+        'mean_ms': sum(samples) / len(samples) * 1000,
+        'p50_ms': percentile(samples, 50) * 1000,
+        'p95_ms': percentile(samples, 95) * 1000,
+    }
+
+def tokens(text):
+    return re.findall(r"\w+", text.lower())
+
+def token_f1(answer, reference):
+    answer, reference = tokens(answer), tokens(reference)
+    if not answer or not reference:
+        return float(answer == reference)
+    common = sum(min(answer.count(t), reference.count(t)) for t in set(answer))
+    if common == 0:
+        return 0.0
+    precision, recall = common / len(answer), common / len(reference)
+    return 2 * precision * recall / (precision + recall)
+
+def run_profile(profile, model_name, repeat):
+    import torch
+
+    start = time.perf_counter()
+    tokenizer = profile.load_tokenizer(model_name)
+    model = profile.load_model(model_name)
+    load_seconds = time.perf_counter() - start
+
+    texts = [f"question: {question} context: {context}" for question, context in QUESTIONS]
+    tokenize, generate, answers = [], [], []
+    for i, text in enumerate(texts * (repeat + 1)):
+        started = time.perf_counter()
+        inputs = tokenizer([text], return_tensors="pt", max_length=1024, truncation=True, padding=True)
+        tokenized = time.perf_counter()
+        with torch.no_grad():
+            outputs = model.generate(inputs["input_ids"], attention_mask=inputs["attention_mask"],
+                                     **profile.generate_kwargs)
+        answer = tokenizer.batch_decode(outputs, skip_special_tokens=True)[0]
+        finished = time.perf_counter()
+        # The first pass over the questions is warm-up
+        if i < len(texts):
+            answers.append(answer)
+            continue
+        tokenize.append(tokenized - started)
+        generate.append(finished - tokenized)
+
+    return {
+        'profile': profile.stats(),
+        'load_seconds': load_seconds,
+        'model_mb': model_size_bytes(model) / (1024 * 1024),
+        'tokenize': summarize(tokenize),
+        'generate': summarize(generate),
+        'total': summarize([a + b for a, b in zip(tokenize, generate)]),
+        'answers': answers,
+    }
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--model', default='t5-base')
+    parser.add_argument('--profiles', nargs='+', default=list(PROFILES), choices=list(PROFILES))
+    parser.add_argument('--threads', type=int, default=0, help='thread budget for the non-baseline profiles')
+    parser.add_argument('--repeat', type=int, default=3, help='timed passes over the question set')
+    parser.add_argument('--output', help='write results as JSON to this file')
+    args = parser.parse_args()
+
+    has_onnx = importlib.util.find_spec('optimum') is not None and importlib.util.find_spec('onnxruntime') is not None
+    names = ['baseline'] + [name for name in args.profiles if name != 'baseline']
+    results = {'config': {'model': args.model, 'threads': args.threads, 'repeat': args.repeat,
+                          'questions': len(QUESTIONS), 'cpus': os.cpu_count()}}
+    for name in names:
+        settings = dict(PROFILES[name])
+        if settings['runtime'] == 'onnx' and not has_onnx:
+            results[name] = {'skipped': 'optimum[onnxruntime] is not installed'}
+            continue
+        if name != 'baseline' and args.threads:
+            settings['threads'] = args.threads
+        results[name] = run_profile(T5Profile(**settings), args.model, args.repeat)
+        print(f"{name}: {results[name]['total']['mean_ms']:.0f} ms/question", file=sys.stderr)
+
+    reference = results['baseline']['answers']
+    baseline_ms = results['baseline']['total']['mean_ms']
+    for name in names:
+        result = results[name]
+        if 'answers' not in result:
+            continue
+        result['speedup'] = baseline_ms / result['total']['mean_ms']
+        result['parity'] = {
+            'exact_match': sum(a == b for a, b in zip(result['answers'], reference)) / len(reference),
+            'token_f1': sum(token_f1(a, b) for a, b in zip(result['answers'], reference)) / len(reference),
+        }
+
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == '__main__':
+    main()
@@ -26,6 +26,9 @@ var is_chat_open = false
 var server_process_id = -1
 var disconnect = false
 var document_map = {}
+# Document names collected across the pages of /documents
+var fetched_documents = []
+const DOCUMENTS_PAGE_SIZE = 200
 
 func _ready():
 	#start python server
@@ -142,16 +145,24 @@ func setup_connection_indicator():
 	chat_header_indicator.add_theme_stylebox_override("panel", header_circle_style)
 
 func _on_fetch_documents_pressed():
+	fetched_documents.clear()
+	_fetch_documents_page("")
+
+# /documents is paginated: request one page and follow `next` until it is null
+func _fetch_documents_page(after: String):
 	var http_request = HTTPRequest.new()
 	add_child(http_request)
-	var url = "http://localhost:8000/documents"  # Adjust this to your server's URL
+	var url = "http://localhost:8000/documents?status=done&limit=%d" % DOCUMENTS_PAGE_SIZE  # Adjust this to your server's URL
+	if after != "":
+		url += "&after=" + after.uri_encode()
 	var error = http_request.request(url)
 	
 	if error != OK:
 		print("Failed to send request: ", error)
 		add_message("System", "Failed to fetch documents!", false)
+		http_request.queue_free()
 	else:
-		http_request.request_completed.connect(_on_documents_fetched)
+		http_request.request_completed.connect(_on_documents_fetched.bind(http_request))
 
 # Add handler for document button click to show popup
 func _on_documents_button_pressed():
@@ -163,7 +174,8 @@ func _on_documents_button_pressed():
 	# Fetch documents and show in popup
 	_on_fetch_documents_pressed()
 
-func _on_documents_fetched(result: int, response_code: int, headers: PackedStringArray, body: PackedByteArray):
+func _on_documents_fetched(result: int, response_code: int, headers: PackedStringArray, body: PackedByteArray, http_request: HTTPRequest):
+	http_request.queue_free()
 	if result != HTTPRequest.RESULT_SUCCESS:
 		print("Error during fetch: ", result)
 		add_message("System", "Failed to fetch documents!", false)
@@ -174,13 +186,14 @@ func _on_documents_fetched(result: int, response_code: int, headers: PackedStrin
 		var error = json.parse(body.get_string_from_utf8())
 		if error == OK:
 			var response = json.get_data()
-			var documents = response.get("documents", [])
-			var document_filenames = []
-			for doc in documents:
+			for item in response.get("items", []):
 				# Extract just the filename from the path
-				var document_name = doc.get_file()
-				document_filenames.append(document_name)
-			_populate_document_menu(document_filenames)
+				fetched_documents.append(str(item.get("name", "")).get_file())
+			var next_cursor = response.get("next")
+			if next_cursor != null:
+				_fetch_documents_page(str(next_cursor))
+			else:
+				_populate_document_menu(fetched_documents.duplicate())
 		else:
 			print("Failed to parse JSON response")
 			add_message("System", "Failed to parse documents response!", false)
@@ -1,3 +1,13 @@
-from server.connection import ConnectionManager
-from server.ai_agent import AIAgent
-from server.helper import clean_text
\ No newline at end of file
+# Re-exports are resolved lazily so importing a submodule (e.g. server.app)
+# does not pull in the agent and its model dependencies up front.
+_exports = {
+    'ConnectionManager': 'server.connection',
+    'AIAgent': 'server.ai_agent',
+    'clean_text': 'server.helper',
+}
+
+def __getattr__(name):
+    if name in _exports:
+        import importlib
+        return getattr(importlib.import_module(_exports[name]), name)
+    raise AttributeError(f"module 'server' has no attribute {name!r}")
\ No newline at end of file
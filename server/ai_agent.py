@@ -1,45 +1,243 @@
-from langchain_community.document_loaders.pdf import PyPDFDirectoryLoader, PyPDFLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.vectorstores import Chroma
 import langchain_core
-import shutil
+import logging
 import os
-import torch
-from langchain_huggingface import HuggingFaceEmbeddings
-from transformers import T5Tokenizer, T5ForConditionalGeneration
-from server.helper.clean import clean_text
-from langchain_google_genai import ChatGoogleGenerativeAI, GoogleGenerativeAIEmbeddings
+import threading
+from contextlib import aclosing
+from server.helper.clean import clean_many
+from server.helper.pdf_extract import extract_pages
+from server.helper.chunk_ids import file_hash, content_hash, chunk_id
+from server.helper.context import assemble_context, estimate_tokens
+from server.worker_pool import WorkerPool, PoolBusyError
+from server.vector_store import CollectionRegistry
+from server.embedding_cache import CachedEmbeddings
+from server.t5_batcher import T5Batcher
+from server.t5_runtime import T5Profile
+from server.gemini_client import GeminiClient
+from server.model_registry import ModelRegistry
+from concurrent.futures import Future
+from server.router import ActionRouter
+from server.answer_cache import AnswerCache
+from server.asset_index import AssetIndex
+from server.catalog import DocumentCatalog
+from server.metrics import span
 from dotenv import load_dotenv
-import json
+import time
 from langchain.docstore.document import Document
 
+# torch, transformers, Chroma and the Google clients are imported where they are
+# first used, so importing this module (and starting the server) stays fast.
+
 load_dotenv()
+
+class ModelSwitchSuperseded(Exception):
+    pass
+
 class AIAgent:
-    def __init__(self, model_type='t5-base'):
-        os.environ["GOOGLE_API_KEY"] = os.getenv("GOOGLE_API_KEY")
-        self.model_type = model_type
-        self.document = None
+    def __init__(self, model_type='t5-base', embeddings=None, embedding_model="models/text-embedding-004",
+                 chat_model=None):
+        """
+        `embeddings` (an Embeddings instance or a factory for one) and `chat_model`
+        (a factory for the chat model) replace the Google clients, e.g. to run the
+        server offline for benchmarks.
+        """
+        if embeddings is None or chat_model is None:
+            os.environ["GOOGLE_API_KEY"] = os.getenv("GOOGLE_API_KEY")
+        self.chat_model = chat_model
+        # (model_type, model, t5 batcher); replaced as a whole so a request always sees a consistent trio
+        self._active = (model_type, None, None)
         self.chroma_path = './chroma'
-        self.db = None
-        self.retriver = None
+        # Which components are loaded; reported by the readiness endpoint
+        self.components = {'embeddings': False, 'model': False, 't5_tokenizer': False,
+                           'documents': False, '3d_models': False}
+        self._load_lock = threading.Lock()
+        # Bumped by every explicit switch_model call; a load that finishes after a newer switch is not activated
+        self._switch_generation = 0
+        self._switch_lock = threading.Lock()
         #self.langchain_embeddings = HuggingFaceEmbeddings(model_name="distilbert-base-nli-stsb-mean-tokens")
-        self.langchain_embeddings = GoogleGenerativeAIEmbeddings(model="models/text-embedding-004")
-        self.t5tokenizer = T5Tokenizer.from_pretrained("t5-base")
-        
-        self.update_model(model_type)
-    
+        if embeddings is None:
+            embeddings = lambda: self._google_embeddings(embedding_model)
+        self.langchain_embeddings = CachedEmbeddings(
+            embeddings,
+            model_name=embedding_model,
+            path='./embedding_cache/embeddings.sqlite3'
+        )
+        self.components['embeddings'] = True
+        self.collections = CollectionRegistry(self.langchain_embeddings, self.chroma_path)
+        # What is uploaded and ingested, kept in step with the documents collection
+        self.catalog = DocumentCatalog(os.getenv("CATALOG_PATH", './catalog.sqlite3'))
+        self.assets = AssetIndex(self.langchain_embeddings, './public/models/model_description.json',
+                                 index_dir='./asset_index')
+        # Page-parallel PDF extraction (text + OCR fallback) on worker processes
+        self.extract_pool = WorkerPool.from_env("EXTRACT", kind='process',
+                                                max_workers=os.cpu_count() or 2, max_queue=1024)
+        self._t5tokenizer = None
+        # Runtime, quantization, thread budget and decoding preset of the local T5 model
+        self.t5_profile = T5Profile.from_env()
+        self._batchers = {}
+        self.models = ModelRegistry(
+            {'gemini': self._load_gemini, 't5-base': self._load_t5},
+            memory_budget_mb=int(os.getenv("MODEL_MEMORY_BUDGET_MB", 4096)),
+            on_evict=self._model_evicted,
+        )
+        # Bumped whenever the documents collection changes; part of every answer cache key
+        self.corpus_version = 0
+        self.answer_cache = AnswerCache(
+            max_items=int(os.getenv("ANSWER_CACHE_SIZE", 512)),
+            ttl=float(os.getenv("ANSWER_CACHE_TTL", 3600)),
+            semantic=os.getenv("ANSWER_CACHE_SEMANTIC", "0") == "1",
+            embed_fn=self.langchain_embeddings.embed_query,
+        )
+        self.router = ActionRouter(similarity_fn=self._object_similarity, llm_fallback=self._llm_decision,
+                                   cache_context_fn=lambda: (self.model_type, self.assets.version))
+        # Speculative routing: search documents and 3D assets while the router decides
+        self.speculative = os.getenv("SPECULATIVE_ROUTING", "1") == "1"
+        self.speculation_pool = WorkerPool.from_env("SPECULATE", max_workers=8, max_queue=32)
+        # Prompt context budgets, in tokens
+        self.context_budgets = {
+            'gemini': int(os.getenv("GEMINI_CONTEXT_TOKENS", 4000)),
+            't5-base': int(os.getenv("T5_MAX_INPUT_TOKENS", 1024)),
+        }
+        self.context_mmr = os.getenv("CONTEXT_MMR", "0") == "1"
+        # The model itself is loaded by warm_up() or on first use
+
+    def _google_embeddings(self, embedding_model):
+        from langchain_google_genai import GoogleGenerativeAIEmbeddings
+
+        return GoogleGenerativeAIEmbeddings(model=embedding_model)
+
+    @property
+    def t5tokenizer(self):
+        if self._t5tokenizer is None:
+            with self._load_lock:
+                if self._t5tokenizer is None:
+                    self._t5tokenizer = self.t5_profile.load_tokenizer("t5-base")
+                    self.components['t5_tokenizer'] = True
+        return self._t5tokenizer
+
+    def warm_up(self):
+        """
+        Loads everything a request may need. Meant to run in the background after
+        the server has started listening.
+        """
+        self._ensure_model()
+        self.collections.get('documents')
+        self.sync_catalog('./public')
+        self.components['documents'] = True
+        self.load_3d_models()
+        self.components['3d_models'] = True
+
+    def readiness(self):
+        required = ['embeddings', 'model', 'documents', '3d_models']
+        if self.model_type != 'gemini':
+            required.append('t5_tokenizer')
+        return {
+            'ready': all(self.components[name] for name in required),
+            'model_type': self.model_type,
+            'components': dict(self.components),
+        }
+
+    @property
+    def model_type(self):
+        return self._active[0]
+
+    @property
+    def model(self):
+        return self._active[1]
+
+    @property
+    def t5_batcher(self):
+        return self._active[2] if self._active[0] != 'gemini' else None
+
+    @property
+    def gemini_client(self):
+        return self._active[2] if self._active[0] == 'gemini' else None
+
+    def _ensure_model(self):
+        # First-use load: joins any load of the same model already running and does not
+        # count as a switch, so it never supersedes (or is superseded by) a POST /model
+        if self._active[1] is None:
+            model_type = self._active[0]
+            model = self.models.load(model_type).result()
+            with self._switch_lock:
+                if self._active[1] is None:
+                    self._activate(model_type, model)
+        return self._active
+
     def update_model(self, model_type):
-        self.model_type = model_type
-        if self.model_type == 'gemini':
-            self.model = ChatGoogleGenerativeAI(
-                                model="gemini-1.5-flash",
-                                temperature=0,
-                                max_tokens=None,
-                                timeout=None,
-                                max_retries=2,
-                       )
+        return self.switch_model(model_type).result()
+
+    def switch_model(self, model_type):
+        """
+        Loads `model_type` in the background (instantly if resident) and then swaps
+        it in atomically. Requests already running keep the model they started with.
+        Returns a future that resolves once the new model is active, or fails with
+        ModelSwitchSuperseded if another switch was requested while it loaded.
+        """
+        switched = Future()
+        with self._switch_lock:
+            self._switch_generation += 1
+            generation = self._switch_generation
+
+        def activate(loaded):
+            try:
+                model = loaded.result()
+                with self._switch_lock:
+                    if generation != self._switch_generation:
+                        raise ModelSwitchSuperseded(f"Switch to {model_type} was superseded by a later switch")
+                    self._activate(model_type, model)
+                switched.set_result(model_type)
+            except Exception as e:
+                switched.set_exception(e)
+
+        self.models.load(model_type).add_done_callback(activate)
+        return switched
+
+    def _activate(self, model_type, model):
+        # The third slot schedules requests onto the model: a T5Batcher, or a GeminiClient for Gemini
+        batcher = self._batchers.get(model_type)
+        if model_type == 'gemini':
+            if batcher is None or batcher.model is not model:
+                batcher = GeminiClient.from_env(model)
+                self._batchers[model_type] = batcher
         else:
-            self.model = T5ForConditionalGeneration.from_pretrained("t5-base")
+            if batcher is None or batcher.model is not model:
+                batcher = T5Batcher(
+                    model,
+                    self.t5tokenizer,
+                    window_ms=float(os.getenv("T5_BATCH_WINDOW_MS", 10)),
+                    max_batch_size=int(os.getenv("T5_MAX_BATCH_SIZE", 8)),
+                    generate_kwargs=self.t5_profile.generate_kwargs,
+                )
+                self._batchers[model_type] = batcher
+        self.models.pin(model_type)
+        self._active = (model_type, model, batcher)
+        self.components['model'] = True
+
+    def _model_evicted(self, model_type, model):
+        # In-flight requests on this batcher still finish; new ones never see it
+        batcher = self._batchers.pop(model_type, None)
+        if batcher is not None:
+            batcher.close()
+
+    def _load_gemini(self):
+        if self.chat_model is not None:
+            return self.chat_model()
+
+        from langchain_google_genai import ChatGoogleGenerativeAI
+
+        return ChatGoogleGenerativeAI(
+                            model="gemini-1.5-flash",
+                            temperature=0,
+                            max_tokens=None,
+                            # GeminiClient enforces the overall deadline and retries on top of this
+                            timeout=float(os.getenv("GEMINI_DEADLINE", 30)),
+                            max_retries=2,
+                   )
+
+    def _load_t5(self):
+        # Load the tokenizer here too so activation never waits on it
+        self.t5tokenizer
+        return self.t5_profile.load_model("t5-base")
 
     # def load_document(self, path):
         # document_loader = PyPDFDirectoryLoader(path)
@@ -57,19 +255,81 @@ class AIAgent:
         # ]
         # self.split_text()
 
-    def load_single_document(self, path):
-        document_loader = PyPDFLoader(path)
-        loaded_document = document_loader.load()
-        self.document = [
+    def load_single_document(self, path, progress=None):
+        """
+        Runs the ingestion pipeline (load, clean, split, embed, store) for one PDF.
+        `progress(stage)` is called before each stage. Returns per-stage timings in
+        seconds and per-page extraction timings.
+        """
+        timings = {}
+        name = os.path.basename(path)
+
+        def stage(name, fn, *args):
+            if progress is not None:
+                progress(name)
+            start = time.perf_counter()
+            with span(name):
+                result = fn(*args)
+            timings[name] = time.perf_counter() - start
+            return result
+
+        # Re-uploading an unchanged file is a no-op
+        source_hash = stage('hash', file_hash, path)
+        if self.is_ingested(path, source_hash):
+            logging.info(f"{path} is unchanged, skipping ingestion.")
+            self.catalog.upsert(name, path, size=os.path.getsize(path), content_hash=source_hash, status='done')
+            return {'stages': timings, 'pages': [], 'chunks': {'added': 0, 'removed': 0, 'kept': 0}, 'skipped': True}
+
+        pages, page_timings = stage('load', self.load_pages, path)
+        pages = stage('clean', self.clean_pages, pages)
+        chunks = stage('split', self.split_text, pages, source_hash)
+        added, stale_ids, kept = self.plan_chunks(path, chunks)
+        # Only chunks that are new to the collection are embedded and written
+        stage('embed', self.embed_chunks, added)
+        stage('store', self.tokenize_and_store, added, stale_ids, kept)
+        # Only once the chunks really were written; a failed store is recorded by the ingestion queue
+        self.catalog.upsert(name, path, size=os.path.getsize(path), content_hash=source_hash,
+                            pages=len(pages), chunks=len(added) + len(kept), status='done',
+                            error=None, ingested_at=time.time())
+        return {
+            'stages': timings,
+            'pages': page_timings,
+            'chunks': {'added': len(added), 'removed': len(stale_ids), 'kept': len(kept)},
+            'skipped': False
+        }
+
+    def is_ingested(self, source, source_hash):
+        db = self.collections.get('documents')
+        existing = db.get(where={"$and": [{"source": source}, {"file_hash": source_hash}]}, limit=1, include=[])
+        return len(existing['ids']) > 0
+
+    def load_pages(self, path):
+        extracted = extract_pages(path, pool=self.extract_pool)
+        pages = [
+            Document(page_content=page['text'], metadata={'source': path, 'page': page['page']})
+            for page in extracted
+        ]
+        page_timings = [
+            {'page': page['page'], 'seconds': page['seconds'], 'ocr': page['ocr']}
+            for page in extracted
+        ]
+        ocr_pages = sum(1 for page in extracted if page['ocr'])
+        logging.info(f"Extracted {len(pages)} pages ({ocr_pages} via OCR) from {path}.")
+        return pages, page_timings
+
+    def clean_pages(self, pages):
+        cleaned = clean_many([doc.page_content for doc in pages], pool=self.extract_pool)
+        return [
             langchain_core.documents.base.Document(
-                page_content=clean_text(doc.page_content),
+                page_content=text,
                 metadata=doc.metadata
             )
-            for doc in loaded_document
+            for doc, text in zip(pages, cleaned)
         ]
-        self.split_text()
 
-    def split_text(self):
+    def split_text(self, documents, source_hash=None):
+        from langchain.text_splitter import RecursiveCharacterTextSplitter
+
         text_splitter = RecursiveCharacterTextSplitter(
             chunk_size=300,  # Reduce chunk size
             chunk_overlap=50,  # Adjust overlap
@@ -77,79 +337,78 @@ class AIAgent:
             add_start_index=True,
         )
 
-        chunks = text_splitter.split_documents(self.document)
-        self.document = chunks
-        self.tokenize_and_store()
-
-    def tokenize_and_store(self):
-        self.db = Chroma.from_documents(
-            self.document,
-            self.langchain_embeddings,
-            collection_name="documents",
-            persist_directory=self.chroma_path
-        )
-        self.retriver = self.db.as_retriever()
-        print(f"Saved {len(self.document)} chunks to {self.chroma_path}.")
-
-    def retrive_documents(self, question, collection_name, persistant=True):
-        if persistant:
-            db = Chroma(collection_name=collection_name, 
-                    embedding_function=self.langchain_embeddings,
-                    persist_directory=self.chroma_path)
-        else:
-            # for now store the 3d objects in memory
-            db = Chroma(collection_name=collection_name, 
-                    embedding_function=self.langchain_embeddings)
-        self.retriver = db.as_retriever()
-        # Retrieve the most relevant documents
-        results = self.retriver.get_relevant_documents(question)
-
-        if results:
-            print(f"Top {len(results)} Retrieved Document(s):")
-            for i, result in enumerate(results[:5]):
-                # Add document path and page number in the output
-                print(f"Document {i+1}: Path: {result.metadata.get('source')}, Page Number: {result.metadata.get('page')}, Content: {result.page_content[:500]}...")
-            return results
-        
-        return []
-
-    def load_3d_models(self):
-        json_path = './public/models/model_description.json'
+        chunks = text_splitter.split_documents(documents)
+        # Deterministic IDs from source, page, offset and content make re-ingestion idempotent
+        for chunk in chunks:
+            chunk_hash = content_hash(chunk.page_content)
+            chunk.metadata['content_hash'] = chunk_hash
+            if source_hash is not None:
+                chunk.metadata['file_hash'] = source_hash
+            chunk.id = chunk_id(chunk.metadata.get('source'), chunk.metadata.get('page'),
+                                chunk.metadata.get('start_index'), chunk_hash)
+        return chunks
 
-        # Check if the file exists
-        if not os.path.exists(json_path):
-            return
+    def plan_chunks(self, source, chunks):
+        """
+        Diffs freshly split chunks against what is stored for `source`.
+        Returns (chunks to add, stale IDs to delete, chunks already stored).
+        """
+        db = self.collections.get('documents')
+        existing_ids = set(db.get(where={"source": source}, include=[])['ids'])
+        unique = {}
+        for chunk in chunks:
+            unique.setdefault(chunk.id, chunk)
+        added = [chunk for chunk_id_, chunk in unique.items() if chunk_id_ not in existing_ids]
+        kept = [chunk for chunk_id_, chunk in unique.items() if chunk_id_ in existing_ids]
+        stale_ids = list(existing_ids - unique.keys())
+        return added, stale_ids, kept
 
-        # Check if the file is empty
-        if os.path.getsize(json_path) == 0:
-            return
+    def embed_chunks(self, chunks):
+        # Fills the embedding cache so the store step does not wait on the provider
+        return self.langchain_embeddings.embed_documents([chunk.page_content for chunk in chunks])
 
-        # Load JSON data
-        with open(json_path, 'r') as f:
-            try:
-                model_description = json.load(f)
-            except json.JSONDecodeError:
-                return
+    def tokenize_and_store(self, chunks, stale_ids=None, kept=None):
+        db = self.collections.get('documents')
+        if chunks:
+            db.add_documents(chunks, ids=[chunk.id for chunk in chunks])
+        if stale_ids:
+            db.delete(stale_ids)
+        if kept:
+            # Unchanged chunks stay embedded; only their file hash moves to the new version
+            db._collection.update(ids=[chunk.id for chunk in kept],
+                                  metadatas=[chunk.metadata for chunk in kept])
+        if chunks or stale_ids:
+            self._corpus_changed()
+        logging.info(f"Saved {len(chunks)} new chunks to {self.chroma_path}, removed {len(stale_ids or [])} stale chunks.")
 
-        # Check if the JSON is an empty array
-        if not model_description or not isinstance(model_description, list):
-            return
+    def _corpus_changed(self):
+        self.corpus_version += 1
+        self.answer_cache.invalidate()
 
-        # Process valid data
-        document_ids = [model["path"] for model in model_description]  # Use the path as the ID
-        documents = [
-            Document(page_content=model["description"], metadata={"path": model["path"]})
-            for model in model_description
-        ]
-
-        self.db = Chroma.from_documents(documents, 
-                                        self.langchain_embeddings, 
-                                        ids=document_ids, 
-                                        collection_name='3d_object_descriptions')
+    def retrive_documents(self, question, collection_name, persistant=True, vector=None):
+        # Shared, long-lived retriever; never rebuilt on the query path
+        retriver = self.collections.retriever(collection_name, persistant)
+        # Retrieve the most relevant documents
+        with span('retrieve'):
+            if vector is None:
+                results = retriver.invoke(question)
+            else:
+                # Already embedded (speculative routing); same k as the retriever
+                db = self.collections.get(collection_name, persistant)
+                results = db.similarity_search_by_vector(vector, k=retriver.search_kwargs.get('k', 4))
 
-        self.retriver = self.db.as_retriever()
+        # Content dumps are only built when debug logging is on
+        if results and logging.getLogger().isEnabledFor(logging.DEBUG):
+            logging.debug(f"Top {len(results)} Retrieved Document(s) from {collection_name}:")
+            for i, result in enumerate(results[:5]):
+                # Add document path and page number in the output
+                logging.debug(f"Document {i+1}: Path: {result.metadata.get('source')}, Page Number: {result.metadata.get('page')}, Content: {result.page_content[:500]}...")
+        return results or []
 
-        print(f"Saved {len(documents)} chunks to {self.chroma_path}. Models")
+    def load_3d_models(self):
+        # Persistent, incrementally refreshed index; only changed descriptions are embedded
+        self.assets.refresh()
+        logging.info(f"Loaded {len(self.assets)} 3D models.")
 
     def decide_action(self, question):
         if self.model_type != 'gemini':
@@ -160,59 +419,81 @@ class AIAgent:
         If the input suggests generating a 3D model, return 'generate'.  
         Otherwise, return 'answer'. Question: {question}"""
         
-        decision = self.model.invoke(prompt)
+        _, _, client = self._ensure_model()
+        with span('decide_action'):
+            decision = client.invoke(prompt)
         decision = decision.content
         
         return decision
-        
-    def generate_object(self, question):
-        results = self.retrive_documents(question, '3d_object_descriptions', False)
-        
+
+    def _llm_decision(self, question):
+        # Only consulted by the router when its local rules are inconclusive
+        if self.model_type != 'gemini':
+            return None
+        decision = self.decide_action(question).strip().lower()
+        return 'generate' if 'generate' in decision else 'answer'
+
+    def _object_similarity(self, question):
+        results = self.assets.search_text(question, k=1)
+        return results[0][1] if results else 0.0
+
+    def generate_object(self, question, results=None):
+        if results is None:
+            results = self.assets.search_text(question, k=1)
+
         # select the top result
         if not results:
             return "No relevant documents found."
-        
-        document = results[0]
-        path = document.metadata.get('path')
-        
+
+        path, _ = results[0]
+
         response = {'type': 'generate', 'response': path}
 
         return response
 
-    def answer_question(self, question):
-        results = self.retrive_documents(question, 'documents')
-        if not results:
-            response = {
-                'answer': 'Sorry, I could not find any relevant documents for your question.',
-                'metadata': []
-            }
-            return {'type': 'answer', 
-                    'response': response}
+    def _no_results_response(self):
+        response = {
+            'answer': 'Sorry, I could not find any relevant documents for your question.',
+            'metadata': []
+        }
+        return {'type': 'answer',
+                'response': response}
 
-        # Extract the content from the results
-        documents = "\n\n".join([result.page_content for result in results])
-        
-        if self.model_type == 'gemini':
-            prompt = f"""You are an assistant for question-answering tasks.
+    def _gemini_prompt(self, question, documents):
+        return f"""You are an assistant for question-answering tasks.
             Use the following context to answer the question.
             If you don't know the answer, just say that you don't know.
             Use five sentences maximum and keep the answer concise.\n
             Question: {question} \nContext: {documents} \nAnswer:"""
-            
-            predicted_answer = self.model.invoke(prompt)
-            predicted_answer = predicted_answer.content
-           
-        else:
-            # Combine the question and context into a single string
-            input_text = f"question: {question} context: {documents}"
-            inputs = self.t5tokenizer(input_text, return_tensors="pt", max_length=1024, truncation=True, padding=True)
 
-            with torch.no_grad():
-                outputs = self.model.generate(inputs["input_ids"], max_length=50, num_beams=4, early_stopping=True)
+    def _t5_input_text(self, question, documents):
+        # Combine the question and context into a single string
+        return f"question: {question} context: {documents}"
+
+    def _build_context(self, question, results, model_type):
+        """
+        Packs the retrieved chunks into the model's token budget, after merging
+        overlapping neighbours and dropping near-duplicates.
+        """
+        if model_type == 'gemini':
+            # Exact Gemini counts need an API round trip, so estimate instead
+            count_tokens = estimate_tokens
+            budget = self.context_budgets['gemini'] - count_tokens(self._gemini_prompt(question, ""))
+        else:
+            def count_tokens(text):
+                return len(self.t5tokenizer.encode(text, add_special_tokens=False))
+            # Leave room for the question and the end-of-sequence token
+            budget = self.context_budgets['t5-base'] - count_tokens(self._t5_input_text(question, "")) - 1
 
-            predicted_answer = self.t5tokenizer.decode(outputs[0], skip_special_tokens=True)
+        mmr = {}
+        if self.context_mmr:
+            # Mostly cache hits: unmerged chunks were embedded at ingestion, the question at retrieval
+            mmr = {'passage_vectors_fn': self.langchain_embeddings.embed_documents,
+                   'query_vector': self.langchain_embeddings.embed_query(question)}
+        return assemble_context(results, budget, count_tokens, **mmr)
 
-        # Now, return the predicted answer along with the document path and page number
+    def _answer_response(self, predicted_answer, results):
+        # Return the predicted answer along with the document path and page number
         answer_with_metadata = []
         for result in results:
             document_info = {
@@ -221,36 +502,291 @@ class AIAgent:
             }
             answer_with_metadata.append(document_info)
 
-            response = {
-                "answer": predicted_answer,
-                "metadata": answer_with_metadata
-            }
-            
-        final_response = {'type': 'answer', 'response': response}
+        response = {
+            "answer": predicted_answer,
+            "metadata": answer_with_metadata
+        }
+        return {'type': 'answer', 'response': response}
+
+    def _prepare_answer(self, question, model_type, results=None, cache_as=None):
+        """
+        Cache lookup, retrieval (unless `results` were already retrieved) and context
+        packing. Returns (response, results, documents, corpus version); `response`
+        is set when there is nothing to generate. `cache_as` replaces `model_type`
+        in the answer cache key.
+        """
+        version = self.corpus_version
+        cache_as = cache_as or model_type
+        cached = self.answer_cache.get(question, cache_as, version)
+        if cached is not None:
+            return cached, None, None, version
+
+        if results is None:
+            results = self.retrive_documents(question, 'documents')
+        if not results:
+            response = self._no_results_response()
+            self.answer_cache.put(question, cache_as, version, response)
+            return response, None, None, version
+
+        with span('context'):
+            documents = self._build_context(question, results, model_type)
+        return None, results, documents, version
+
+    def answer_question(self, question, results=None):
+        model_type, model, batcher = self._ensure_model()
+        response, results, documents, version = self._prepare_answer(question, model_type, results)
+        if response is not None:
+            return response
+
+        with span('generate'):
+            if model_type == 'gemini':
+                # Bounded concurrency, deadline, retries and circuit breaker; see GeminiClient
+                predicted_answer = batcher.invoke(self._gemini_prompt(question, documents))
+                predicted_answer = predicted_answer.content
+
+            else:
+                # Concurrent questions are micro-batched into one padded generate() call
+                predicted_answer = batcher.generate(self._t5_input_text(question, documents))
+
+        response = self._answer_response(predicted_answer, results)
+        self.answer_cache.put(question, model_type, version, response)
+        return response
+
+    def stream_answer(self, question, results=None):
+        """
+        Same as answer_question, but yields 'answer_delta' frames as tokens arrive
+        and finishes with the usual 'answer' frame carrying the source metadata.
+        """
+        model_type, model, batcher = self._ensure_model()
+        # T5 streams greedily (T5Profile.stream_kwargs) but answer_question uses beam
+        # search, so streamed T5 answers have their own cache entries
+        cache_as = model_type if model_type == 'gemini' else f"{model_type}:stream"
+        response, results, documents, version = self._prepare_answer(question, model_type, results, cache_as)
+        if response is not None:
+            yield response
+            return
+        parts = []
+
+        # Includes the time the client takes to consume each delta
+        with span('generate_stream'):
+            if model_type == 'gemini':
+                for chunk in batcher.stream(self._gemini_prompt(question, documents)):
+                    if chunk.content:
+                        parts.append(chunk.content)
+                        yield {'type': 'answer_delta', 'delta': chunk.content}
+            else:
+                input_text = self._t5_input_text(question, documents)
+                inputs = self.t5tokenizer(input_text, return_tensors="pt", max_length=1024, truncation=True, padding=True)
+                import torch
+                from transformers import StoppingCriteria, StoppingCriteriaList, TextIteratorStreamer
+
+                streamer = TextIteratorStreamer(self.t5tokenizer, skip_prompt=True, skip_special_tokens=True)
+                # Set when the consumer stops reading (cancelled request, closed stream)
+                cancelled = threading.Event()
+                errors = []
+
+                class Cancelled(StoppingCriteria):
+                    def __call__(self, input_ids, scores, **kwargs):
+                        return torch.full((input_ids.shape[0],), cancelled.is_set(), dtype=torch.bool,
+                                          device=input_ids.device)
+
+                def run_generate():
+                    try:
+                        with torch.no_grad():
+                            model.generate(inputs["input_ids"], streamer=streamer,
+                                           stopping_criteria=StoppingCriteriaList([Cancelled()]),
+                                           **self.t5_profile.stream_kwargs)
+                    except Exception as e:
+                        # Unblock the consumer; the error is raised there
+                        errors.append(e)
+                        streamer.end()
+
+                generation = threading.Thread(target=run_generate, daemon=True)
+                generation.start()
+                try:
+                    for text in streamer:
+                        if text:
+                            parts.append(text)
+                            yield {'type': 'answer_delta', 'delta': text}
+                finally:
+                    cancelled.set()
+                    generation.join()
+                if errors:
+                    raise errors[0]
+
+        response = self._answer_response("".join(parts), results)
+        self.answer_cache.put(question, cache_as, version, response)
+        yield response
+
+    def _route(self, question, similarity_fn=None):
+        with span('route'):
+            return self.router.route(question, similarity_fn)
+
+    def _speculate(self, question):
+        """
+        Routes the question while both possible next steps already run: the question
+        is embedded once and that vector searches the documents and the 3D assets
+        in parallel with the routing decision (which may be a Gemini call). Returns
+        (decision, search results for that decision); the other search is cancelled,
+        or its result dropped if it already started. Results are None when the
+        speculation pool is full, and the caller then searches as usual.
+        """
+        if not self.speculative:
+            return self._route(question), None
+        vector = self.langchain_embeddings.embed_query(question)
+        try:
+            documents = self.speculation_pool.submit(self.retrive_documents, question, 'documents', vector=vector)
+        except PoolBusyError:
+            return self._route(question), None
+        try:
+            assets = self.speculation_pool.submit(self.assets.search, vector, 1)
+        except PoolBusyError:
+            documents.cancel()
+            return self._route(question), None
+
+        def similarity(_):
+            # Same score the router would compute, from the search already under way
+            top = assets.result()
+            return top[0][1] if top else 0.0
+
+        decision = self._route(question, similarity)
+        if decision == 'generate':
+            documents.cancel()
+            return decision, assets.result()
+        assets.cancel()
+        return decision, documents.result()
 
-        return final_response
     def generate_answer(self, question):
-        decision = self.decide_action(question)
+        decision, results = self._speculate(question)
         
         if decision == 'generate':
-            return self.generate_object(question)
+            return self.generate_object(question, results)
         else:
-            return self.answer_question(question)
+            return self.answer_question(question, results)
+
+    def stream_generate_answer(self, question):
+        decision, results = self._speculate(question)
+
+        if decision == 'generate':
+            yield self.generate_object(question, results)
+        else:
+            yield from self.stream_answer(question, results)
+
+    async def agenerate_answer(self, question, run):
+        """
+        Async generate_answer. Blocking steps (routing, retrieval) go through
+        `run`, e.g. WorkerPool.run, and Gemini is awaited on its async client,
+        so no worker thread sits waiting on the API. T5 runs generate_answer via `run`.
+        """
+        model_type, _, client = await run(self._ensure_model)
+        if model_type != 'gemini':
+            return await run(self.generate_answer, question)
+        decision, results = await run(self._speculate, question)
+        if decision == 'generate':
+            return self.generate_object(question, results) if results is not None \
+                else await run(self.generate_object, question)
+
+        response, results, documents, version = await run(self._prepare_answer, question, model_type, results)
+        if response is not None:
+            return response
+        with span('generate'):
+            predicted_answer = await client.ainvoke(self._gemini_prompt(question, documents))
+        response = self._answer_response(predicted_answer.content, results)
+        self.answer_cache.put(question, model_type, version, response)
+        return response
+
+    async def astream_generate_answer(self, question, run, iterate):
+        """
+        Async stream_generate_answer; see agenerate_answer. `iterate` runs a blocking
+        generator on a worker (e.g. WorkerPool.iterate); T5 streams through it.
+        """
+        model_type, _, client = await run(self._ensure_model)
+        if model_type != 'gemini':
+            frames = iterate(self.stream_generate_answer, question)
+            async with aclosing(frames):
+                async for frame in frames:
+                    yield frame
+            return
+        decision, results = await run(self._speculate, question)
+        if decision == 'generate':
+            yield self.generate_object(question, results) if results is not None \
+                else await run(self.generate_object, question)
+            return
+
+        response, results, documents, version = await run(self._prepare_answer, question, model_type, results)
+        if response is not None:
+            yield response
+            return
+        parts = []
+        with span('generate_stream'):
+            async for chunk in client.astream(self._gemini_prompt(question, documents)):
+                if chunk.content:
+                    parts.append(chunk.content)
+                    yield {'type': 'answer_delta', 'delta': chunk.content}
+        response = self._answer_response("".join(parts), results)
+        self.answer_cache.put(question, model_type, version, response)
+        yield response
+
+    def list_document_chunks(self, source):
+        # Filtered metadata query: only touches this document's chunks
+        db = self.collections.get('documents')
+        return db.get(where={"source": source}, include=[])['ids']
+
+    def delete_documents(self, names):
+        """
+        Removes documents from the catalog and their chunks from Chroma. Rows are
+        marked 'deleting' first and only removed once Chroma succeeded; if it fails
+        they get their previous status back. Returns ({name: source} of the
+        documents removed, number of chunks deleted).
+        """
+        marked = self.catalog.mark_deleting(names)
+        if not marked:
+            return {}, 0
+        try:
+            deleted = self.delete_many_from_chroma([source for source, _ in marked.values()])
+        except Exception:
+            self.catalog.restore(marked)
+            raise
+        removed = self.catalog.remove(list(marked))
+        return removed, deleted
+
+    def sync_catalog(self, directory):
+        """
+        Adds PDFs in `directory` that the catalog does not know yet, e.g. those
+        uploaded before it existed, using the chunks Chroma already holds for them.
+        """
+        known = set(self.catalog.names())
+        missing = [name for name in os.listdir(directory) if name.endswith('.pdf') and name not in known] \
+            if os.path.isdir(directory) else []
+        if not missing:
+            return
+        sources = {f'{directory}/{name}': name for name in missing}
+        db = self.collections.get('documents')
+        counts, hashes = {}, {}
+        for metadata in db.get(where={"source": {"$in": list(sources)}}, include=['metadatas'])['metadatas']:
+            counts[metadata['source']] = counts.get(metadata['source'], 0) + 1
+            hashes[metadata['source']] = metadata.get('file_hash')
+        for source, name in sources.items():
+            chunks = counts.get(source, 0)
+            self.catalog.upsert(name, source, size=os.path.getsize(source), content_hash=hashes.get(source),
+                                chunks=chunks, status='done' if chunks else 'uploaded')
+        logging.info(f"Added {len(missing)} existing documents to the catalog.")
 
     def delete_from_chroma(self, source):
+        return self.delete_many_from_chroma([source])
+
+    def delete_many_from_chroma(self, sources):
         try:
-            db = Chroma(collection_name='documents', 
-                        embedding_function=self.langchain_embeddings,
-                        persist_directory=self.chroma_path)
-            coll = db.get()
-            ids = coll['ids']
-            metadatas = coll['metadatas']
-            ids_to_delete = []
-            
-            for i in range(len(ids)):
-                if metadatas[i].get('source') == source:
-                    ids_to_delete.append(ids[i])
-            db.delete(ids_to_delete)
+            db = self.collections.get('documents')
+            where = {"source": sources[0]} if len(sources) == 1 else {"source": {"$in": list(sources)}}
+            ids_to_delete = db.get(where=where, include=[])['ids']
+            # Chroma caps how many IDs one call may carry
+            batch_size = db._client.get_max_batch_size()
+            for i in range(0, len(ids_to_delete), batch_size):
+                db.delete(ids_to_delete[i:i + batch_size])
+            if ids_to_delete:
+                self._corpus_changed()
+            return len(ids_to_delete)
         except Exception as e:
             raise Exception(f"Error deleting from Chroma: {str(e)}")
 #agent = AIAgent()
@@ -0,0 +1,95 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+from server.helper.clean import normalize_query
+
+class AnswerCache:
+    """
+    LRU/TTL cache of final answers keyed by normalized question, model type and
+    the version of the documents collection. Bumping the corpus version (on
+    ingestion or deletion) makes every older entry unreachable.
+    With `semantic=True`, a miss falls back to the most similar cached question
+    for the same model and corpus version, if it is above `similarity_threshold`.
+    The raw question is embedded, not the normalized key, so the vector is the
+    same embedding-cache entry retrieval uses for that question.
+    """
+    def __init__(self, max_items=512, ttl=3600, semantic=False, similarity_threshold=0.95, embed_fn=None):
+        self.max_items = max_items
+        self.ttl = ttl
+        self.semantic = semantic and embed_fn is not None
+        self.similarity_threshold = similarity_threshold
+        self.embed_fn = embed_fn
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _key(self, question, model_type, version):
+        return (normalize_query(question or ""), model_type, version)
+
+    def get(self, question, model_type, version):
+        key = self._key(question, model_type, version)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                response, expires, _ = entry
+                if expires > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return response
+                del self._entries[key]
+
+        if self.semantic:
+            response = self._semantic_get(question, key, now)
+            if response is not None:
+                return response
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def _semantic_get(self, question, key, now):
+        vector = self.embed_fn(question or "")
+        best, best_score = None, self.similarity_threshold
+        with self._lock:
+            for (_, model_type, version), (response, expires, cached_vector) in self._entries.items():
+                if model_type != key[1] or version != key[2] or expires <= now or cached_vector is None:
+                    continue
+                score = _cosine(vector, cached_vector)
+                if score >= best_score:
+                    best, best_score = response, score
+            if best is not None:
+                self.semantic_hits += 1
+        return best
+
+    def put(self, question, model_type, version, response):
+        key = self._key(question, model_type, version)
+        vector = self.embed_fn(question or "") if self.semantic else None
+        with self._lock:
+            self._entries[key] = (response, time.monotonic() + self.ttl, vector)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_items:
+                self._entries.popitem(last=False)
+
+    def invalidate(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.semantic_hits + self.misses
+            return {
+                'hits': self.hits,
+                'semantic_hits': self.semantic_hits,
+                'misses': self.misses,
+                'hit_ratio': (self.hits + self.semantic_hits) / total if total else 0.0,
+                'entries': len(self._entries),
+            }
+
+def _cosine(a, b):
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
@@ -1,73 +1,406 @@
+import asyncio
 import json
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, File, UploadFile
-from server.connection import ConnectionManager
-from server.ai_agent import AIAgent
+from contextlib import asynccontextmanager, aclosing
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, File, UploadFile, Form, Query
+from typing import List, Optional
+from server.connection import ConnectionManager, ENCODINGS
+from server.ai_agent import AIAgent, ModelSwitchSuperseded
+from server.worker_pool import WorkerPool, PoolBusyError
+from server.ingestion import IngestionQueue
+from server.uploads import UploadManager, UploadError, CHUNK_MAGIC
+from server.gemini_client import CircuitOpenError, GeminiTimeoutError
+from server.catalog import STATUSES
+from server import metrics
 from fastapi.staticfiles import StaticFiles
-import glob
 import os
 from fastapi.responses import JSONResponse, Response
 from pydantic import BaseModel
 import logging
 
-app = FastAPI()
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"))
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Start listening right away; models and the 3D catalog load in the background
+    warm_up_task = asyncio.create_task(warm_up())
+    yield
+    warm_up_task.cancel()
+
+app = FastAPI(lifespan=lifespan)
 
 manager = ConnectionManager()
+# Blocking agent work (Gemini/T5 calls, Chroma) runs here instead of on the event loop.
+# Torch and the HTTP clients release the GIL, so threads are the default; tune with AGENT_POOL_*.
+agent_pool = WorkerPool.from_env("AGENT", max_workers=4, max_queue=16)
+# PDF ingestion jobs get their own pool so large uploads never starve chat
+ingest_pool = WorkerPool.from_env("INGEST", max_workers=1, max_queue=32)
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+# Chat requests with a request_id that one connection may have in flight at once
+MAX_REQUESTS_PER_CONNECTION = int(os.getenv("WS_MAX_IN_FLIGHT", 8))
 
 agent = AIAgent(model_type="gemini")
 project_path = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))       
 # agent.load_document(f'{project_path}/server/public')
-agent.load_3d_models()
+
+async def warm_up():
+    try:
+        await asyncio.to_thread(agent.warm_up)
+        logging.info("Agent warm-up complete")
+    except Exception as e:
+        logging.error(f"Agent warm-up failed: {e}")
+
+async def notify_ingest_progress(job):
+    if job["session_id"] is None:
+        return
+    await manager.send(job["session_id"], json.dumps({
+        "type": "ingest_progress",
+        "job_id": job["id"],
+        "name": job["filename"],
+        "status": job["status"],
+        "stage": job["stage"],
+        "progress": job["progress"],
+        "error": job["error"]
+    }))
+
+def remove_failed_upload(job):
+    if os.path.exists(job.path):
+        os.remove(job.path)
+
+ingestion = IngestionQueue(agent, ingest_pool, notify=notify_ingest_progress, on_failure=remove_failed_upload)
+# Resumable binary uploads over /ws; partial files live outside the served public directory
+uploads = UploadManager(f'{project_path}/server/.uploads',
+                        max_size=int(os.getenv("UPLOAD_MAX_BYTES", 512 * 1024 * 1024)),
+                        ttl=float(os.getenv("UPLOAD_TTL", 3600)))
+
+# Read when /metrics is scraped; the agent is looked up each time so it can be swapped (see benchmarks)
+CHAT_MESSAGES = metrics.REGISTRY.counter('chatbot_chat_messages_total', 'Chat messages handled over /ws.', ['outcome'])
+metrics.REGISTRY.gauge('chatbot_active_connections', 'Open WebSocket connections.',
+                       lambda: manager.active_connections())
+metrics.REGISTRY.gauge('chatbot_ws_requests_in_flight', 'Multiplexed chat requests being answered.',
+                       lambda: manager.requests_in_flight())
+metrics.REGISTRY.gauge('chatbot_pool_queue_depth', 'Tasks waiting for a free worker.',
+                       lambda: {'agent': agent_pool.queue_depth(), 'ingest': ingest_pool.queue_depth(),
+                                'speculate': agent.speculation_pool.queue_depth()}, label='pool')
+metrics.REGISTRY.callback_counter('chatbot_pool_rejected_total', 'Tasks rejected because the pool was full.',
+                                  lambda: {'agent': agent_pool.rejected, 'ingest': ingest_pool.rejected,
+                                            'speculate': agent.speculation_pool.rejected}, label='pool')
+metrics.REGISTRY.gauge('chatbot_ingest_jobs', 'Recent ingestion jobs by status.',
+                       lambda: {status: sum(1 for job in list(ingestion.jobs.values()) if job.status == status)
+                                for status in ('queued', 'running', 'done', 'failed')}, label='status')
+metrics.REGISTRY.callback_counter('chatbot_cache_hits_total', 'Cache hits.',
+                                  lambda: {'embedding': agent.langchain_embeddings.hits,
+                                           'answer': agent.answer_cache.hits + agent.answer_cache.semantic_hits},
+                                  label='cache')
+metrics.REGISTRY.callback_counter('chatbot_cache_misses_total', 'Cache misses.',
+                                  lambda: {'embedding': agent.langchain_embeddings.misses,
+                                           'answer': agent.answer_cache.misses}, label='cache')
+metrics.REGISTRY.gauge('chatbot_cache_entries', 'Entries held in memory.',
+                       lambda: {'embedding': agent.langchain_embeddings.stats()['memory_items'],
+                                'answer': agent.answer_cache.stats()['entries']}, label='cache')
+metrics.REGISTRY.gauge('chatbot_gemini_in_flight', 'Gemini requests currently waiting on the API.',
+                       lambda: agent.gemini_client.in_flight if agent.gemini_client is not None else 0)
+metrics.REGISTRY.callback_counter('chatbot_gemini_events_total', 'Gemini client retries, hedges, timeouts and failures.',
+                                  lambda: {name: value for name, value in agent.gemini_client.stats().items()
+                                           if name in ('requests', 'retries', 'hedges', 'hedge_wins', 'timeouts',
+                                                       'failures', 'rejected')}
+                                  if agent.gemini_client is not None else {}, label='event')
+metrics.REGISTRY.callback_counter('chatbot_route_decisions_total', 'Router decisions by what decided them.',
+                                  lambda: {source: count for source, count in agent.router.stats().items()
+                                           if source != 'cached_decisions'}, label='source')
 
 app.mount("/public", StaticFiles(directory=f'{project_path}/server/public/'), name="public")
 
+async def handle_upload_message(session_id, message_data):
+    """
+    upload_start (new or resumed with upload_id), upload_status and upload_cancel.
+    The reply lists the byte ranges already received so a client only sends the rest.
+    """
+    message_type = message_data.get("type")
+    upload_id = message_data.get("upload_id")
+    if message_type == "upload_start":
+        upload = uploads.start(message_data.get("name"), message_data.get("total_size"),
+                               sha256=message_data.get("sha256"), session_id=session_id, upload_id=upload_id)
+        await manager.send(session_id, json.dumps({"type": "upload_ready", **upload.status()}))
+        if upload.is_complete():
+            await finish_upload(session_id, upload)
+    elif message_type == "upload_status":
+        upload = uploads.get(upload_id)
+        if upload is None:
+            raise UploadError(f"Unknown upload {upload_id}")
+        await manager.send(session_id, json.dumps({"type": "upload_ack", **upload.status()}))
+    elif message_type == "upload_cancel":
+        uploads.cancel(upload_id)
+        await manager.send(session_id, json.dumps({"type": "upload_cancelled", "upload_id": upload_id}))
+
+async def handle_upload_chunk(session_id, frame):
+    # The file write is small but may block on disk, so keep it off the event loop
+    upload = await asyncio.to_thread(uploads.write_chunk, frame)
+    await manager.send(session_id, json.dumps({"type": "upload_ack", **upload.status()}))
+    if upload.is_complete():
+        await finish_upload(session_id, upload)
+
+async def finish_upload(session_id, upload):
+    path = f'{project_path}/server/public/{upload.name}'
+    if not await asyncio.to_thread(uploads.finish, upload, path):
+        return
+    try:
+        job = await ingestion.submit(upload.name, path, f'./public/{upload.name}', session_id=session_id)
+    except PoolBusyError as e:
+        os.remove(path)
+        await manager.send(session_id, json.dumps({
+            "type": "upload_error", "upload_id": upload.id, "code": "busy", "message": str(e)
+        }))
+        return
+    await manager.send(session_id, json.dumps({
+        "type": "upload_complete", "upload_id": upload.id, "name": upload.name, "job_id": job.id
+    }))
+
+async def handle_chat(session_id, message_data):
+    """
+    Answers one chat message. When the message carries a request_id, every frame
+    sent for it carries the same request_id so the client can match them up.
+    """
+    query = message_data.get("content")
+    request_id = message_data.get("request_id")
+
+    def tagged(frame):
+        if request_id is None:
+            return frame
+        if not isinstance(frame, dict):
+            frame = {"type": "chat", "message": frame}
+        return {**frame, "request_id": request_id}
+
+    try:
+        if message_data.get("stream"):
+            # Forward answer_delta frames as tokens arrive, then the final answer
+            if agent.model_type == 'gemini':
+                # Gemini streams from its async client; only retrieval uses a worker
+                frames = agent.astream_generate_answer(query, agent_pool.run, agent_pool.iterate)
+            else:
+                frames = agent_pool.iterate(agent.stream_generate_answer, query)
+            # aclosing: a cancelled request stops its stream right away instead of at garbage collection
+            with metrics.span('chat_stream'):
+                async with aclosing(frames):
+                    async for frame in frames:
+                        await manager.send_frame(session_id, tagged(frame))
+            CHAT_MESSAGES.inc(outcome=frame["type"] if isinstance(frame, dict) else "other")
+            return
+        # Blocking steps run on agent_pool; Gemini calls are awaited without holding a worker
+        with metrics.span('chat'):
+            response = await agent.agenerate_answer(query, agent_pool.run)
+        CHAT_MESSAGES.inc(outcome=response["type"] if isinstance(response, dict) else "other")
+    except asyncio.CancelledError:
+        CHAT_MESSAGES.inc(outcome="cancelled")
+        raise
+    except PoolBusyError as e:
+        CHAT_MESSAGES.inc(outcome="busy")
+        response = {
+            "type": "error",
+            "code": "busy",
+            "message": str(e)
+        }
+    except CircuitOpenError as e:
+        CHAT_MESSAGES.inc(outcome="unavailable")
+        response = {"type": "error", "code": "unavailable", "message": str(e)}
+    except GeminiTimeoutError as e:
+        CHAT_MESSAGES.inc(outcome="timeout")
+        response = {"type": "error", "code": "timeout", "message": str(e)}
+    # Send the response back to the client that asked
+    await manager.send_frame(session_id, tagged(response))
+
+async def start_request(session, message_data):
+    """
+    Runs a chat message with a request_id as its own task, so the connection can
+    keep reading (more questions, cancels) while it is answered.
+    """
+    request_id = message_data["request_id"]
+    error = None
+    if not isinstance(request_id, (str, int)):
+        error = {"code": "invalid_request", "message": "request_id must be a string or an integer"}
+    elif request_id in session.requests:
+        error = {"code": "duplicate_request", "message": f"Request {request_id} is already in flight"}
+    elif len(session.requests) >= MAX_REQUESTS_PER_CONNECTION:
+        CHAT_MESSAGES.inc(outcome="busy")
+        error = {"code": "busy", "message": f"At most {MAX_REQUESTS_PER_CONNECTION} requests may be in flight"}
+    if error is not None:
+        await manager.send_frame(session.id, {"type": "error", "request_id": request_id, **error})
+        return
+
+    async def run():
+        try:
+            await handle_chat(session.id, message_data)
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            await manager.send_frame(session.id, {"type": "error", "request_id": request_id, "message": str(e)})
+        finally:
+            if session.requests.get(request_id) is task:
+                del session.requests[request_id]
+
+    task = asyncio.create_task(run())
+    session.requests[request_id] = task
+
+async def cancel_request(session, request_id):
+    # Queued work is dropped from the pool; running Gemini calls are aborted, a running
+    # T5 stream stops at its next token
+    task = session.requests.pop(request_id, None)
+    if task is not None:
+        task.cancel()
+    await manager.send_frame(session.id, {"type": "cancelled", "request_id": request_id, "found": task is not None})
+
+async def handle_hello(session, message_data):
+    # Lets a client learn its session ID, e.g. to receive ingest_progress frames for its uploads,
+    # and opt into MessagePack chat frames
+    encoding = message_data.get("encoding")
+    if encoding in ENCODINGS:
+        session.encoding = encoding
+    await manager.send(session.id, json.dumps({
+        "type": "session",
+        "session_id": session.id,
+        "encoding": session.encoding,
+        "encodings": list(ENCODINGS),
+        "max_in_flight": MAX_REQUESTS_PER_CONNECTION,
+    }))
+
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
-    await manager.connect(websocket)
-    print('connected')
+    """
+    Text frames are JSON messages. Binary frames are upload chunks, or MessagePack
+    messages once the client has chosen that encoding in `hello`. Chat messages
+    with a request_id are answered concurrently and can be cancelled; without one
+    they are answered in order, one at a time. Large answers are compressed by
+    permessage-deflate when the client offers it (uvicorn's default).
+    """
+    session_id = await manager.connect(websocket)
+    session = manager.get(session_id)
+    logging.info(f'connected {session_id}')
     try:
         while True:
-            data = await websocket.receive_text()
-            # Parse the incoming message as JSON
-            message_data = json.loads(data)
-            if message_data.get("type") == "chat":
-                # Get the actual message content
-                query = message_data.get("content")
-                # Use the instance of AIAgent
-                response = agent.generate_answer(query)
-                # Send the response back to the client
-                await manager.send(json.dumps(response))
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            data = message.get("bytes")
+            if data is not None and (session.encoding != 'msgpack' or data[:len(CHUNK_MAGIC)] == CHUNK_MAGIC):
+                # Binary frames are upload chunks
+                try:
+                    await handle_upload_chunk(session_id, data)
+                except UploadError as e:
+                    await manager.send(session_id, json.dumps({"type": "upload_error", "message": str(e)}))
+                continue
+            # Parse the incoming message as JSON (or MessagePack)
+            message_data = session.decode(data) if data is not None else json.loads(message["text"])
+            message_type = message_data.get("type")
+            if message_type in ("upload_start", "upload_status", "upload_cancel"):
+                try:
+                    await handle_upload_message(session_id, message_data)
+                except UploadError as e:
+                    await manager.send(session_id, json.dumps({
+                        "type": "upload_error", "upload_id": message_data.get("upload_id"), "message": str(e)
+                    }))
+            elif message_type == "hello":
+                await handle_hello(session, message_data)
+            elif message_type == "cancel" and isinstance(message_data.get("request_id"), (str, int)):
+                await cancel_request(session, message_data["request_id"])
+            elif message_type == "chat":
+                if message_data.get("request_id") is not None:
+                    await start_request(session, message_data)
+                else:
+                    # Replies without a request_id are matched by order, so answer before reading on
+                    await handle_chat(session_id, message_data)
     except WebSocketDisconnect:
-        manager.disconnect()
+        pass
     except Exception as e:
         error_response = {
             "type": "error",
             "message": str(e)
         }
-        await manager.send(json.dumps(error_response))
+        await manager.send(session_id, json.dumps(error_response))
+    finally:
+        await manager.disconnect(session_id)
 
 @app.post("/upload")
-async def upload_pdf(file: UploadFile, response: Response):
+async def upload_pdf(file: UploadFile, response: Response, session_id: Optional[str] = Form(None)):
+    path = f'{project_path}/server/public/{file.filename}'
     try:
-        contents = await file.read()
-        with open(f'{project_path}/server/public/{file.filename}', "wb") as f:
-            f.write(contents)
-        
-        agent.load_single_document(f'./public/{file.filename}')
-        return {"message": "File uploaded successfully"}
+        # Copy in fixed-size chunks so memory use does not grow with the file
+        with open(path, "wb") as f:
+            while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                f.write(chunk)
+
+        job = await ingestion.submit(file.filename, path, f'./public/{file.filename}', session_id=session_id)
+        return {"message": "File uploaded successfully", "job_id": job.id}
+    except PoolBusyError as e:
+        os.remove(path)
+        response.status_code = 503
+        return {"error": str(e)}
     except Exception as e:
-        os.remove(f"{project_path}/server/public/{file.filename}")
+        if os.path.exists(path):
+            os.remove(path)
         response.status_code = 500
         return {"error": str(e)}
 
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str, response: Response):
+    job = ingestion.get(job_id)
+    if job is None:
+        response.status_code = 404
+        return {"error": "Job not found"}
+    return job.to_dict()
+
 @app.get("/documents")
-async def get_documents(response: Response):
+async def get_documents(response: Response, limit: int = 100, after: Optional[str] = None,
+                        status: Optional[str] = None, prefix: Optional[str] = None,
+                        include_all: bool = Query(False, alias="all")):
+    """
+    One page of the document catalog in `items`, ordered by name. Pass the returned
+    `next` as `after` to get the following page; filter by ingestion `status` or
+    name `prefix`. With `all=1` the response also has `documents`, the names of all
+    ingested documents, for clients that do not paginate; that list grows with the
+    catalog, so it is opt-in.
+    """
+    if status is not None and status not in STATUSES:
+        response.status_code = 400
+        return {"error": f"Unknown status. Supported statuses are {', '.join(STATUSES)}"}
     try:
-        files = [file.split('/')[-1] for file in glob.glob(f"{project_path}/server/public/*.pdf")]
-        return {"documents": files}
+        items, next_cursor = await asyncio.to_thread(agent.catalog.list, limit=max(1, min(limit, 1000)),
+                                                     after=after, status=status, prefix=prefix)
+        page = {"items": items, "next": next_cursor}
+        if include_all:
+            # Names only, read from the (status, name) index
+            page["documents"] = await asyncio.to_thread(agent.catalog.names, 'done')
+        return page
     except Exception as e:
         response.status_code = 500
         return {"error": str(e)}
 
+@app.get("/ready")
+async def get_readiness(response: Response):
+    readiness = agent.readiness()
+    if not readiness["ready"]:
+        response.status_code = 503
+    return readiness
+
+@app.get("/stats")
+async def get_stats():
+    stats = {
+        "embedding_cache": agent.langchain_embeddings.stats(),
+        "router": agent.router.stats(),
+        "answer_cache": agent.answer_cache.stats(),
+        "models": agent.models.stats(),
+        "documents": agent.catalog.stats(),
+    }
+    if agent.t5_batcher is not None:
+        stats["t5_batcher"] = agent.t5_batcher.stats()
+        stats["t5_profile"] = agent.t5_profile.stats()
+    if agent.gemini_client is not None:
+        stats["gemini"] = agent.gemini_client.stats()
+    return stats
+
+@app.get("/metrics")
+async def get_metrics():
+    # Prometheus text exposition format
+    return Response(content=metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 class ModelUpdateRequest(BaseModel):
     model_type: str
 
@@ -84,13 +417,23 @@ async def update_model(request: ModelUpdateRequest, response: Response):
         response.status_code = 400
         return {"error": "Invalid model type. Supported types are t5-base and gemini"}
     try:
-        agent.update_model(model_type)
+        # Loads in the background (instant if already resident); other requests keep the old model meanwhile
+        await asyncio.wrap_future(agent.switch_model(model_type))
         response.status_code = 200
         return {"message": "Model updated successfully"}
+    except ModelSwitchSuperseded as e:
+        response.status_code = 409
+        return {"error": str(e)}
     except Exception as e:
         response.status_code = 500
         return {"error": str(e)}
     
+def remove_document_files(names):
+    for name in names:
+        path = f"{project_path}/server/public/{name}"
+        if os.path.exists(path):
+            os.remove(path)
+
 class DocumentDeleteRequest(BaseModel):
     document_name: str
 
@@ -98,11 +441,37 @@ class DocumentDeleteRequest(BaseModel):
 async def delete_document(request: DocumentDeleteRequest, response: Response):
     document_name = request.document_name
     try:
-        os.remove(f"{project_path}/server/public/{document_name}")
+        # Catalog row and Chroma chunks go together; the file is removed once both are gone
+        removed, _ = await agent_pool.run(agent.delete_documents, [document_name])
+        if not removed:
+            response.status_code = 404
+            return {"error": "Document not found"}
+        remove_document_files(removed)
         response.status_code = 200
-        agent.delete_from_chroma(f'./public/{document_name}')
         return {"message": "Document deleted successfully"}
     except Exception as e:
         logging.info(f"Error deleting a file {e}")
         response.status_code = 500
-        return {"error": f"Error deleting a file {e}"}
\ No newline at end of file
+        return {"error": f"Error deleting a file {e}"}
+
+class BulkDeleteRequest(BaseModel):
+    document_names: List[str]
+
+@app.post('/delete/bulk')
+async def delete_documents(request: BulkDeleteRequest, response: Response):
+    if not request.document_names:
+        response.status_code = 400
+        return {"error": "At least one document name is required"}
+    try:
+        # One filtered delete for all documents instead of one scan per document
+        removed, deleted = await agent_pool.run(agent.delete_documents, request.document_names)
+        remove_document_files(removed)
+        return {
+            "message": "Documents deleted successfully",
+            "deleted_chunks": deleted,
+            "not_found": [name for name in request.document_names if name not in removed],
+        }
+    except Exception as e:
+        logging.info(f"Error deleting files {e}")
+        response.status_code = 500
+        return {"error": f"Error deleting files {e}"}
\ No newline at end of file
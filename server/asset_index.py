@@ -0,0 +1,193 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import numpy as np
+
+class AssetIndex:
+    """
+    Persistent vector index for the 3D asset catalog (model_description.json).
+    Normalized float32 embeddings live in a memory-mapped .npy matrix next to a
+    small JSON file with the asset paths, the catalog's mtime/size/hash and the
+    embedding model and dimension. refresh() only re-embeds descriptions that
+    changed since the last build (everything, if the embedding model changed),
+    and search() is a single matrix-vector product plus a partial sort.
+    """
+    def __init__(self, embeddings, json_path, index_dir='./asset_index', check_interval=5.0, model_name=None):
+        self.embeddings = embeddings
+        self.model_name = model_name or getattr(embeddings, 'model_name', type(embeddings).__name__)
+        self.json_path = json_path
+        self.index_dir = index_dir
+        self.check_interval = check_interval
+        self.meta_path = os.path.join(index_dir, 'meta.json')
+        # (matrix, paths) swapped as one tuple so searches never see a half-built index
+        self._index = (np.zeros((0, 0), dtype=np.float32), [])
+        self._meta = None
+        # Bumped whenever the searchable contents change, e.g. to invalidate cached routing decisions
+        self.version = 0
+        self._last_check = 0.0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._index[1])
+
+    def _read_meta(self):
+        if self._meta is None and os.path.exists(self.meta_path):
+            with open(self.meta_path, 'r') as f:
+                self._meta = json.load(f)
+        return self._meta
+
+    def _write_meta(self, meta):
+        tmp_path = self.meta_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, self.meta_path)
+        self._meta = meta
+
+    def _load_matrix(self, meta):
+        matrix_path = os.path.join(self.index_dir, meta['matrix'])
+        if meta['items'] and os.path.exists(matrix_path):
+            matrix = np.load(matrix_path, mmap_mode='r')
+        else:
+            matrix = np.zeros((0, 0), dtype=np.float32)
+        self._index = (matrix, [item['path'] for item in meta['items']])
+
+    def refresh(self):
+        """
+        Brings the index in line with the catalog file. Returns True if it was rebuilt.
+        """
+        with self._lock:
+            self._last_check = time.monotonic()
+            os.makedirs(self.index_dir, exist_ok=True)
+            meta = self._read_meta()
+            # Vectors from another embedding model are neither searchable nor reusable
+            compatible = meta is not None and meta.get('model') == self.model_name
+
+            if not os.path.exists(self.json_path) or os.path.getsize(self.json_path) == 0:
+                if self._index[1]:
+                    self.version += 1
+                self._index = (np.zeros((0, 0), dtype=np.float32), [])
+                return False
+
+            stat = os.stat(self.json_path)
+            source = {'mtime': stat.st_mtime, 'size': stat.st_size}
+            if compatible and meta['source'].get('mtime') == source['mtime'] \
+                    and meta['source'].get('size') == source['size']:
+                if not self._index[1] and meta['items']:
+                    self._load_matrix(meta)
+                return False
+
+            with open(self.json_path, 'rb') as f:
+                raw = f.read()
+            source['sha256'] = hashlib.sha256(raw).hexdigest()
+            if compatible and meta['source'].get('sha256') == source['sha256']:
+                # Touched but not changed: remember the new mtime and keep the matrix
+                meta['source'] = source
+                self._write_meta(meta)
+                if not self._index[1] and meta['items']:
+                    self._load_matrix(meta)
+                return False
+
+            try:
+                catalog = json.loads(raw)
+            except json.JSONDecodeError:
+                logging.info(f"Could not parse {self.json_path}, keeping the previous asset index")
+                return False
+            if not isinstance(catalog, list):
+                catalog = []
+
+            if meta is not None and not compatible:
+                logging.info(f"Asset index was built with {meta.get('model')}, re-embedding with {self.model_name}")
+            self._rebuild(meta, source, catalog, reuse=compatible)
+            return True
+
+    def _rebuild(self, meta, source, catalog, reuse=True):
+        items = [
+            {'path': model['path'],
+             'description_hash': hashlib.sha256(model['description'].encode('utf-8')).hexdigest()}
+            for model in catalog
+        ]
+        descriptions = [model['description'] for model in catalog]
+
+        # Reuse rows whose path and description are unchanged
+        old_rows = {}
+        if reuse and not self._index[1] and meta['items']:
+            # First refresh since a restart: the old vectors are still on disk
+            self._load_matrix(meta)
+        old_matrix = self._index[0]
+        if reuse and len(old_matrix) == len(meta['items']):
+            old_rows = {(item['path'], item['description_hash']): row for row, item in enumerate(meta['items'])}
+        missing = [i for i, item in enumerate(items) if (item['path'], item['description_hash']) not in old_rows]
+
+        new_vectors = {}
+        if missing:
+            vectors = self.embeddings.embed_documents([descriptions[i] for i in missing])
+            new_vectors = dict(zip(missing, vectors))
+            if old_rows and len(vectors[0]) != old_matrix.shape[1]:
+                # Same model name but a different dimension: nothing old can be mixed in
+                logging.info("Embedding dimension changed, re-embedding every 3D model description")
+                old_rows = {}
+                missing = list(range(len(items)))
+                new_vectors = dict(zip(missing, self.embeddings.embed_documents(descriptions)))
+
+        if items:
+            dim = len(next(iter(new_vectors.values()))) if new_vectors else old_matrix.shape[1]
+            matrix = np.empty((len(items), dim), dtype=np.float32)
+            for i, item in enumerate(items):
+                if i in new_vectors:
+                    matrix[i] = new_vectors[i]
+                else:
+                    matrix[i] = old_matrix[old_rows[(item['path'], item['description_hash'])]]
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            matrix /= norms
+        else:
+            matrix = np.zeros((0, 0), dtype=np.float32)
+
+        # Write a new file and switch to it; an mmapped file in use cannot be replaced on Windows
+        # Named by catalog and model, so a rebuild never overwrites the mapped file
+        key = hashlib.sha256(f"{source['sha256']}:{self.model_name}".encode('utf-8')).hexdigest()
+        matrix_name = f"embeddings-{key[:16]}.npy"
+        np.save(os.path.join(self.index_dir, matrix_name), matrix)
+        previous = meta['matrix'] if meta is not None else None
+        new_meta = {'source': source, 'matrix': matrix_name, 'items': items,
+                    'model': self.model_name, 'dim': int(matrix.shape[1])}
+        self._write_meta(new_meta)
+        self._load_matrix(new_meta)
+        self.version += 1
+        if previous and previous != matrix_name:
+            try:
+                os.remove(os.path.join(self.index_dir, previous))
+            except OSError:
+                pass
+        logging.info(f"Indexed {len(items)} 3D models ({len(missing)} embedded, {len(items) - len(missing)} reused).")
+
+    def _maybe_refresh(self):
+        if time.monotonic() - self._last_check > self.check_interval:
+            self.refresh()
+
+    def search(self, query_vector, k=1):
+        """
+        Returns up to k (path, cosine similarity) pairs, best first.
+        """
+        self._maybe_refresh()
+        matrix, paths = self._index
+        if not paths:
+            return []
+        query = np.asarray(query_vector, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm:
+            query = query / norm
+        scores = matrix @ query
+        k = min(k, len(paths))
+        if k < len(paths):
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+        else:
+            top = np.argsort(-scores)
+        return [(paths[i], float(scores[i])) for i in top]
+
+    def search_text(self, text, k=1):
+        return self.search(self.embeddings.embed_query(text), k)
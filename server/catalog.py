@@ -0,0 +1,203 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+COLUMNS = ('name', 'source', 'size', 'content_hash', 'pages', 'chunks', 'status', 'error', 'job_id',
+           'timings', 'created_at', 'updated_at', 'ingested_at')
+STATUSES = ('uploaded', 'queued', 'running', 'done', 'failed', 'deleting')
+
+class DocumentCatalog:
+    """
+    Persistent record of every uploaded document: size, content hash, page and
+    chunk counts, ingestion status and stage timings, and the `source` key its
+    chunks carry in Chroma.
+
+    Listing uses keyset pagination over indexes on name and (status, name), so
+    a page costs the same with ten documents or ten thousand. Writes go through
+    one connection and a lock and are short: no lock is held while Chroma is
+    written, callers update the catalog before and after instead. Reads use a
+    second connection (WAL mode).
+    """
+    def __init__(self, path='./catalog.sqlite3'):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.RLock()
+        self._read_lock = threading.Lock()
+        # isolation_level=None: transactions are begun and ended explicitly in transaction()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS documents (
+                name TEXT PRIMARY KEY,
+                source TEXT NOT NULL,
+                size INTEGER,
+                content_hash TEXT,
+                pages INTEGER,
+                chunks INTEGER,
+                status TEXT NOT NULL,
+                error TEXT,
+                job_id TEXT,
+                timings TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                ingested_at REAL
+            )""")
+        self._db.execute("CREATE INDEX IF NOT EXISTS documents_status_name ON documents (status, name)")
+        self._reader = sqlite3.connect(path, check_same_thread=False)
+        self._reader.row_factory = sqlite3.Row
+        self._in_transaction = False
+
+    @contextmanager
+    def transaction(self):
+        """
+        Groups catalog writes so they commit together; rolled back if the block
+        raises. Nested blocks join the outer transaction. Keep slow work (Chroma
+        calls) outside, the write lock is held throughout.
+        """
+        with self._lock:
+            if self._in_transaction:
+                yield self
+                return
+            self._db.execute("BEGIN IMMEDIATE")
+            self._in_transaction = True
+            try:
+                yield self
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            else:
+                self._db.execute("COMMIT")
+            finally:
+                self._in_transaction = False
+
+    def upsert(self, name, source, **fields):
+        """
+        Creates or updates the row for `name`; `fields` are any other columns.
+        """
+        unknown = set(fields) - set(COLUMNS)
+        if unknown:
+            raise ValueError(f"Unknown catalog columns: {', '.join(sorted(unknown))}")
+        if 'timings' in fields:
+            fields['timings'] = json.dumps(fields['timings'])
+        now = time.time()
+        fields = {'source': source, 'updated_at': now, **fields}
+        columns = ['name', 'created_at', *fields]
+        updates = ', '.join(f"{column} = excluded.{column}" for column in fields)
+        with self.transaction():
+            self._db.execute(
+                f"INSERT INTO documents ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))}) "
+                f"ON CONFLICT (name) DO UPDATE SET {updates}",
+                [name, now, *fields.values()]
+            )
+
+    def update(self, name, **fields):
+        """
+        Updates columns of an existing row; a no-op if `name` is not catalogued.
+        """
+        if 'timings' in fields:
+            fields['timings'] = json.dumps(fields['timings'])
+        fields['updated_at'] = time.time()
+        with self.transaction():
+            self._db.execute(
+                f"UPDATE documents SET {', '.join(f'{column} = ?' for column in fields)} WHERE name = ?",
+                [*fields.values(), name]
+            )
+
+    def mark_deleting(self, names):
+        """
+        Sets the rows for `names` to 'deleting' and returns {name: (source, previous
+        status)} for those that exist, so a failed delete can put them back.
+        """
+        marked = {}
+        with self.transaction():
+            for i in range(0, len(names), 500):
+                batch = list(names[i:i + 500])
+                placeholders = ','.join('?' * len(batch))
+                rows = self._db.execute(
+                    f"SELECT name, source, status FROM documents WHERE name IN ({placeholders}) "
+                    f"AND status != 'deleting'", batch
+                ).fetchall()
+                marked.update((name, (source, status)) for name, source, status in rows)
+            self._db.executemany("UPDATE documents SET status = 'deleting', updated_at = ? WHERE name = ?",
+                                 [(time.time(), name) for name in marked])
+        return marked
+
+    def restore(self, marked):
+        # Compensates mark_deleting() when the Chroma delete failed
+        with self.transaction():
+            self._db.executemany("UPDATE documents SET status = ?, updated_at = ? WHERE name = ?",
+                                 [(status, time.time(), name) for name, (_, status) in marked.items()])
+
+    def remove(self, names):
+        """
+        Deletes the rows for `names` and returns {name: source} for those that existed.
+        """
+        removed = {}
+        with self.transaction():
+            # sqlite caps the number of bound parameters, so work in slices
+            for i in range(0, len(names), 500):
+                batch = list(names[i:i + 500])
+                placeholders = ','.join('?' * len(batch))
+                rows = self._db.execute(
+                    f"SELECT name, source FROM documents WHERE name IN ({placeholders})", batch
+                ).fetchall()
+                removed.update(rows)
+                self._db.execute(f"DELETE FROM documents WHERE name IN ({placeholders})", batch)
+        return removed
+
+    def get(self, name):
+        with self._read_lock:
+            row = self._reader.execute("SELECT * FROM documents WHERE name = ?", (name,)).fetchone()
+        return self._to_dict(row) if row is not None else None
+
+    def names(self, status=None):
+        """
+        All document names in order, optionally only those with `status`.
+        """
+        query, params = "SELECT name FROM documents", []
+        if status is not None:
+            query, params = query + " WHERE status = ?", [status]
+        with self._read_lock:
+            return [row[0] for row in self._reader.execute(query + " ORDER BY name", params)]
+
+    def list(self, limit=50, after=None, status=None, prefix=None):
+        """
+        One page of documents ordered by name, starting after the name `after`
+        (the previous page's cursor). Returns (documents, next cursor or None).
+        """
+        where, params = [], []
+        if status is not None:
+            where.append("status = ?")
+            params.append(status)
+        if prefix:
+            # A range instead of LIKE, so the name index is used
+            where.append("name >= ? AND name < ?")
+            params.extend([prefix, prefix + '\U0010ffff'])
+        if after is not None:
+            where.append("name > ?")
+            params.append(after)
+        query = "SELECT * FROM documents"
+        if where:
+            query += " WHERE " + " AND ".join(where)
+        # One extra row tells whether there is a next page without counting the rest
+        query += " ORDER BY name LIMIT ?"
+        params.append(limit + 1)
+        with self._read_lock:
+            rows = self._reader.execute(query, params).fetchall()
+        documents = [self._to_dict(row) for row in rows[:limit]]
+        next_cursor = documents[-1]['name'] if len(rows) > limit else None
+        return documents, next_cursor
+
+    def _to_dict(self, row):
+        document = dict(row)
+        document['timings'] = json.loads(document['timings']) if document['timings'] else {}
+        return document
+
+    def stats(self):
+        with self._read_lock:
+            rows = self._reader.execute("SELECT status, COUNT(*) FROM documents GROUP BY status").fetchall()
+        return {status: count for status, count in rows}
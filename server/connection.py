@@ -1,12 +1,114 @@
+import asyncio
+import json
+import logging
+import uuid
 from fastapi import WebSocket
 
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+ENCODINGS = ('json', 'msgpack') if msgpack is not None else ('json',)
+
+class Session:
+    def __init__(self, websocket: WebSocket, max_queue: int = 64):
+        self.id = uuid.uuid4().hex
+        self.websocket = websocket
+        self.queue = asyncio.Queue(maxsize=max_queue)
+        self.sender = None
+        # Encoding of chat frames: JSON text, or MessagePack binary if the client asked for it
+        self.encoding = 'json'
+        # request_id -> task answering it, for clients that multiplex requests
+        self.requests = {}
+
+    def encode(self, frame):
+        if self.encoding == 'msgpack':
+            return msgpack.packb(frame, use_bin_type=True)
+        return json.dumps(frame)
+
+    def decode(self, data):
+        return msgpack.unpackb(data, raw=False)
+
+    def cancel_requests(self):
+        # Nobody is left to read the answers, so stop the work behind them
+        current = asyncio.current_task()
+        for task in list(self.requests.values()):
+            if task is not current:
+                task.cancel()
+
+    async def run_sender(self):
+        # Drain this socket's queue; a slow client only ever blocks its own sender
+        while True:
+            message = await self.queue.get()
+            if message is None:
+                break
+            try:
+                if isinstance(message, bytes):
+                    await self.websocket.send_bytes(message)
+                else:
+                    await self.websocket.send_text(message)
+            except Exception as e:
+                logging.info(f"Send to session {self.id} failed: {e}")
+                break
+
 class ConnectionManager:
-    def __init__(self):
-        self.connection = None
-    async def connect(self, websocket: WebSocket):
+    def __init__(self, max_queue: int = 64, send_timeout: float = 5.0):
+        self.sessions = {}
+        self.max_queue = max_queue
+        self.send_timeout = send_timeout
+
+    async def connect(self, websocket: WebSocket) -> str:
         await websocket.accept()
-        self.connection = websocket
-    def disconnect(self):
-        self.connection = None
-    async def send(self, message: str):
-        await self.connection.send_text(message)
+        session = Session(websocket, self.max_queue)
+        session.sender = asyncio.create_task(session.run_sender())
+        self.sessions[session.id] = session
+        return session.id
+
+    def get(self, session_id: str):
+        return self.sessions.get(session_id)
+
+    async def disconnect(self, session_id: str):
+        session = self.sessions.pop(session_id, None)
+        if session is None or session.sender is None:
+            return
+        session.cancel_requests()
+        try:
+            # Let the sender flush what is already queued, then stop
+            session.queue.put_nowait(None)
+            await asyncio.wait_for(session.sender, timeout=self.send_timeout)
+        except (asyncio.QueueFull, asyncio.TimeoutError):
+            session.sender.cancel()
+
+    async def send_frame(self, session_id: str, frame):
+        # Encoded per session, see Session.encoding
+        session = self.sessions.get(session_id)
+        if session is not None:
+            await self.send(session_id, session.encode(frame))
+
+    async def send(self, session_id: str, message):
+        session = self.sessions.get(session_id)
+        if session is None:
+            return
+        try:
+            # Backpressure: wait for room in the queue, but drop clients that stay stuck
+            await asyncio.wait_for(session.queue.put(message), timeout=self.send_timeout)
+        except asyncio.TimeoutError:
+            logging.info(f"Session {session_id} send queue full, closing connection")
+            self.sessions.pop(session_id, None)
+            session.sender.cancel()
+            session.cancel_requests()
+            try:
+                await session.websocket.close(code=1013)
+            except Exception:
+                pass
+
+    async def broadcast(self, message: str):
+        for session_id in list(self.sessions):
+            await self.send(session_id, message)
+
+    def active_connections(self) -> int:
+        return len(self.sessions)
+
+    def requests_in_flight(self) -> int:
+        return sum(len(session.requests) for session in list(self.sessions.values()))
@@ -0,0 +1,126 @@
+import hashlib
+import os
+import sqlite3
+import threading
+from array import array
+from collections import OrderedDict
+from langchain_core.embeddings import Embeddings
+from server.metrics import span
+
+class CachedEmbeddings(Embeddings):
+    """
+    Content-addressed cache in front of an embeddings model.
+    Vectors are keyed by model name, embedding kind (document/query, since providers
+    embed them differently) and a hash of the text, kept in an in-memory LRU and
+    persisted to sqlite so restarts and re-uploads skip the provider.
+    `embeddings` may be a zero-argument factory; the provider client is then only
+    built on the first cache miss.
+    """
+    def __init__(self, embeddings, model_name, path='./embedding_cache.sqlite3', max_memory_items=10000):
+        self._embeddings = embeddings
+        self.model_name = model_name
+        self.max_memory_items = max_memory_items
+        self.hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)")
+        self._db.commit()
+
+    @property
+    def embeddings(self):
+        if not hasattr(self._embeddings, 'embed_documents'):
+            with self._lock:
+                if not hasattr(self._embeddings, 'embed_documents'):
+                    self._embeddings = self._embeddings()
+        return self._embeddings
+
+    def _key(self, kind, text):
+        digest = hashlib.sha256(text.encode('utf-8')).hexdigest()
+        return f"{self.model_name}:{kind}:{digest}"
+
+    def _lookup(self, keys):
+        found = {}
+        with self._lock:
+            missing = []
+            for key in keys:
+                if key in self._memory:
+                    self._memory.move_to_end(key)
+                    found[key] = self._memory[key]
+                else:
+                    missing.append(key)
+            # sqlite caps the number of bound parameters, so look up in slices
+            for i in range(0, len(missing), 500):
+                batch = missing[i:i + 500]
+                rows = self._db.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(batch))})", batch
+                ).fetchall()
+                for key, blob in rows:
+                    vector = array('d', blob).tolist()
+                    found[key] = vector
+                    self._remember(key, vector)
+        return found
+
+    def _store(self, items):
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                [(key, array('d', vector).tobytes()) for key, vector in items]
+            )
+            self._db.commit()
+            for key, vector in items:
+                self._remember(key, vector)
+
+    def _remember(self, key, vector):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_items:
+            self._memory.popitem(last=False)
+
+    def embed_documents(self, texts):
+        keys = [self._key('document', text) for text in texts]
+        found = self._lookup(set(keys))
+        # Embed each distinct missing text once, preserving order
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found and key not in missing:
+                missing[key] = text
+        with self._lock:
+            self.hits += len(texts) - len(missing)
+            self.misses += len(missing)
+        if missing:
+            vectors = self.embeddings.embed_documents(list(missing.values()))
+            new_items = list(zip(missing.keys(), vectors))
+            self._store(new_items)
+            found.update(new_items)
+        return [found[key] for key in keys]
+
+    def embed_query(self, text):
+        key = self._key('query', text)
+        # Timed apart: the lookup is local, a miss is a provider round trip
+        with span('embed_query_cache'):
+            found = self._lookup([key])
+        if key in found:
+            with self._lock:
+                self.hits += 1
+            return found[key]
+        with self._lock:
+            self.misses += 1
+        with span('embed_query'):
+            vector = self.embeddings.embed_query(text)
+        self._store([(key, vector)])
+        return vector
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / total if total else 0.0,
+                'memory_items': len(self._memory),
+            }
@@ -0,0 +1,319 @@
+import asyncio
+import os
+import queue
+import random
+import threading
+import time
+
+# HTTP statuses and google.api_core exception names worth retrying
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+RETRYABLE_NAMES = {'ResourceExhausted', 'ServiceUnavailable', 'InternalServerError', 'DeadlineExceeded',
+                   'TooManyRequests', 'BadGateway', 'GatewayTimeout', 'Aborted'}
+
+_DONE = object()
+
+class CircuitOpenError(Exception):
+    pass
+
+class GeminiTimeoutError(TimeoutError):
+    pass
+
+def is_retryable(error):
+    """
+    Timeouts, dropped connections, rate limits and 5xx responses are transient;
+    anything else (bad request, safety block, bad key) fails the same way again.
+    """
+    while error is not None:
+        if isinstance(error, (asyncio.TimeoutError, TimeoutError, ConnectionError)):
+            return True
+        status = getattr(error, 'code', None)
+        if not isinstance(status, int):
+            status = getattr(getattr(error, 'response', None), 'status_code', None)
+        if status in RETRYABLE_STATUS or type(error).__name__ in RETRYABLE_NAMES:
+            return True
+        error = error.__cause__
+    return False
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` transient failures in a row and then fails
+    fast for `cooldown` seconds. After that a single trial request is let
+    through; it closes the breaker on success and reopens it on failure.
+    """
+    def __init__(self, failure_threshold=5, cooldown=30.0):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.state = 'closed'
+        self.failures = 0
+        self.opens = 0
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == 'closed':
+                return True
+            if self.state == 'open' and time.monotonic() - self._opened_at >= self.cooldown:
+                self.state = 'half_open'
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = 'closed'
+            self.failures = 0
+
+    def release(self):
+        """
+        The trial request ended without an answer either way (it was cancelled);
+        go back to open so the next request becomes the trial.
+        """
+        with self._lock:
+            if self.state == 'half_open':
+                self.state = 'open'
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == 'half_open' or self.failures >= self.failure_threshold:
+                if self.state != 'open':
+                    self.opens += 1
+                self.state = 'open'
+                self._opened_at = time.monotonic()
+
+class GeminiClient:
+    """
+    Bounded, fault-tolerant access to a chat model's ainvoke()/astream().
+
+    Every call runs on one dedicated event loop thread, so the model's async
+    client (a pooled gRPC channel that is bound to the loop it was created on)
+    is built once and shared by all requests. Async callers use ainvoke() and
+    astream(); worker threads use invoke() and stream().
+
+    Each request gets a deadline, waits for one of `max_concurrency` slots,
+    is retried with full-jitter exponential backoff on transient errors and,
+    if `hedge_after` is set, races a duplicate request once the first has
+    been running that long and a slot is free. A circuit breaker fails
+    requests fast while the API keeps failing.
+    """
+    def __init__(self, model, max_concurrency=8, deadline=30.0, retries=2, backoff_base=0.25, backoff_max=4.0,
+                 hedge_after=None, breaker=None):
+        self.model = model
+        self.max_concurrency = max_concurrency
+        self.deadline = deadline
+        self.retries = retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.hedge_after = hedge_after
+        self.breaker = breaker or CircuitBreaker()
+        self.requests = 0
+        self.in_flight = 0
+        self.retried = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.timeouts = 0
+        self.failures = 0
+        self.rejected = 0
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name='gemini-io', daemon=True)
+        self._thread.start()
+
+    @classmethod
+    def from_env(cls, model):
+        hedge_after = float(os.getenv("GEMINI_HEDGE_AFTER", 0))
+        return cls(
+            model,
+            max_concurrency=int(os.getenv("GEMINI_MAX_CONCURRENCY", 8)),
+            deadline=float(os.getenv("GEMINI_DEADLINE", 30)),
+            retries=int(os.getenv("GEMINI_RETRIES", 2)),
+            hedge_after=hedge_after or None,
+            breaker=CircuitBreaker(
+                failure_threshold=int(os.getenv("GEMINI_BREAKER_FAILURES", 5)),
+                cooldown=float(os.getenv("GEMINI_BREAKER_COOLDOWN", 30)),
+            ),
+        )
+
+    def _submit(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self._loop)
+
+    async def ainvoke(self, prompt, deadline=None):
+        return await asyncio.wrap_future(self._submit(self._invoke(prompt, deadline)))
+
+    def invoke(self, prompt, deadline=None):
+        return self._submit(self._invoke(prompt, deadline)).result()
+
+    async def astream(self, prompt, deadline=None):
+        loop = asyncio.get_running_loop()
+        chunks = asyncio.Queue()
+
+        def put(item):
+            try:
+                loop.call_soon_threadsafe(chunks.put_nowait, item)
+            except RuntimeError:
+                # The caller's loop is gone; nobody is listening any more
+                pass
+
+        future = self._submit(self._stream(prompt, deadline, put))
+        future.add_done_callback(lambda _: put(_DONE))
+        try:
+            while (item := await chunks.get()) is not _DONE:
+                yield item
+            future.result()
+        finally:
+            future.cancel()
+
+    def stream(self, prompt, deadline=None):
+        chunks = queue.Queue()
+        future = self._submit(self._stream(prompt, deadline, chunks.put))
+        future.add_done_callback(lambda _: chunks.put(_DONE))
+        try:
+            while (item := chunks.get()) is not _DONE:
+                yield item
+            future.result()
+        finally:
+            future.cancel()
+
+    def _start(self, deadline):
+        """
+        Returns (deadline time, whether this request is the breaker's half-open trial).
+        """
+        self.requests += 1
+        if not self.breaker.allow():
+            self.rejected += 1
+            raise CircuitOpenError("Gemini is unavailable right now, please try again shortly")
+        # allow() only runs on this loop's thread, so nothing changed the state in between
+        return time.monotonic() + (deadline or self.deadline), self.breaker.state == 'half_open'
+
+    async def _backoff(self, error, attempt, deadline_at):
+        """
+        Sleeps before the next attempt, or re-raises `error` when it should not be retried.
+        """
+        if not is_retryable(error):
+            # The API answered, so it is up; this request is just bad
+            self.breaker.record_success()
+            self.failures += 1
+            raise error
+        self.breaker.record_failure()
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        if attempt >= self.retries or self.breaker.state == 'open' or time.monotonic() + delay >= deadline_at:
+            self.failures += 1
+            if isinstance(error, (asyncio.TimeoutError, TimeoutError)):
+                self.timeouts += 1
+                raise GeminiTimeoutError("Gemini did not answer in time") from error
+            raise error
+        self.retried += 1
+        await asyncio.sleep(delay)
+
+    async def _invoke(self, prompt, deadline):
+        deadline_at, trial = self._start(deadline)
+        attempt = 0
+        while True:
+            try:
+                result = await asyncio.wait_for(self._hedged(prompt), max(0.0, deadline_at - time.monotonic()))
+                self.breaker.record_success()
+                return result
+            except asyncio.CancelledError:
+                # Otherwise a cancelled trial would leave the breaker half-open for good
+                if trial:
+                    self.breaker.release()
+                raise
+            except Exception as e:
+                await self._backoff(e, attempt, deadline_at)
+                attempt += 1
+
+    async def _call(self, prompt):
+        async with self._semaphore:
+            self.in_flight += 1
+            try:
+                return await self.model.ainvoke(prompt)
+            finally:
+                self.in_flight -= 1
+
+    async def _hedged(self, prompt):
+        primary = asyncio.ensure_future(self._call(prompt))
+        hedge = None
+        try:
+            if self.hedge_after is None:
+                return await primary
+            done, _ = await asyncio.wait({primary}, timeout=self.hedge_after)
+            # Hedges only use spare capacity; they never queue behind real requests
+            if done or self._semaphore.locked():
+                return await primary
+            self.hedges += 1
+            hedge = asyncio.ensure_future(self._call(prompt))
+            pending = {primary, hedge}
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            self.hedge_wins += 1
+                        return task.result()
+            raise primary.exception()
+        finally:
+            primary.cancel()
+            if hedge is not None:
+                hedge.cancel()
+
+    async def _stream(self, prompt, deadline, emit):
+        """
+        Streams chunks to `emit`. Only failures before the first chunk are
+        retried, since a retry would repeat text the caller has already shown.
+        """
+        deadline_at, trial = self._start(deadline)
+        attempt = 0
+        while True:
+            started = False
+            try:
+                async with self._semaphore:
+                    self.in_flight += 1
+                    chunks = self.model.astream(prompt).__aiter__()
+                    try:
+                        while True:
+                            remaining = deadline_at - time.monotonic()
+                            try:
+                                chunk = await asyncio.wait_for(chunks.__anext__(), max(0.0, remaining))
+                            except StopAsyncIteration:
+                                break
+                            started = True
+                            emit(chunk)
+                    finally:
+                        self.in_flight -= 1
+                        if hasattr(chunks, 'aclose'):
+                            await chunks.aclose()
+                self.breaker.record_success()
+                return
+            except asyncio.CancelledError:
+                if trial:
+                    self.breaker.release()
+                raise
+            except Exception as e:
+                if started:
+                    self.failures += 1
+                    if is_retryable(e):
+                        self.breaker.record_failure()
+                    if isinstance(e, (asyncio.TimeoutError, TimeoutError)):
+                        self.timeouts += 1
+                        raise GeminiTimeoutError("Gemini stopped answering before the deadline") from e
+                    raise
+                await self._backoff(e, attempt, deadline_at)
+                attempt += 1
+
+    def close(self):
+        self._loop.call_soon_threadsafe(self._loop.stop)
+
+    def stats(self):
+        return {
+            'requests': self.requests,
+            'in_flight': self.in_flight,
+            'max_concurrency': self.max_concurrency,
+            'retries': self.retried,
+            'hedges': self.hedges,
+            'hedge_wins': self.hedge_wins,
+            'timeouts': self.timeouts,
+            'failures': self.failures,
+            'rejected': self.rejected,
+            'breaker_state': self.breaker.state,
+            'breaker_opens': self.breaker.opens,
+        }
@@ -1 +1 @@
-from server.helper.clean import clean_text
\ No newline at end of file
+from server.helper.clean import clean_text, normalize_query
\ No newline at end of file
@@ -0,0 +1,21 @@
+import hashlib
+
+def file_hash(path, block_size=1024 * 1024):
+    """
+    SHA-256 of a file's bytes, read in blocks.
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while block := f.read(block_size):
+            digest.update(block)
+    return digest.hexdigest()
+
+def content_hash(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+def chunk_id(source, page, start_index, chunk_content_hash):
+    """
+    Stable chunk ID: the same chunk of the same document always maps to the same ID.
+    """
+    key = f"{source}|{page}|{start_index}|{chunk_content_hash}"
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()
@@ -1,26 +1,63 @@
-from PyPDF2 import PdfReader
+import logging
 import re
-import easyocr
-import torch
-import langchain_core
+import math
 
-# Check if GPU is available
-gpu_available = torch.cuda.is_available()
+# EasyOCR reader (GPU if available), created on first use so importing this module
+# stays cheap; each extraction worker process builds at most one
+reader = None
 
-# Initialize EasyOCR reader with GPU support if available
-reader = easyocr.Reader(["en"], gpu=gpu_available)
+def get_reader():
+    global reader
+    if reader is None:
+        import easyocr
+        import torch
+        reader = easyocr.Reader(["en"], gpu=torch.cuda.is_available())
+    return reader
+
+# Precompiled once; clean_text runs for every page of every upload
+PAGE_OF_PATTERN = re.compile(r"^\s*\d+\s*[/of]\s*\d+\s*$", re.IGNORECASE | re.MULTILINE)
+PAGE_RANGE_PATTERN = re.compile(r"^\s*\d+\s*[—-]\s*\d+\s*$", re.MULTILINE)
+PAGE_NUMBER_PATTERN = re.compile(r"^\s*\d+\s*$", re.MULTILINE)
+CAPTION_PATTERN = re.compile(r"^\s*(Figure|Page|Table)\s*\d+\s*$", re.MULTILINE)
+DIGIT_PATTERN = re.compile(r"\d")
+# Replacing [^\w\s] with a space and then collapsing \s+ is the same as collapsing \W+
+SEPARATOR_PATTERN = re.compile(r"\W+")
 
 def clean_text(text):
     """
     Cleans extracted text by removing unwanted patterns and normalizing it.
     """
-    text = re.sub(r"^\s*\d+\s*[/of]\s*\d+\s*$", "", text, flags=re.IGNORECASE | re.MULTILINE)
-    text = re.sub(r"^\s*\d+\s*[—-]\s*\d+\s*$", "", text, flags=re.MULTILINE)
-    text = re.sub(r"^\s*\d+\s*$", "", text, flags=re.MULTILINE)
-    text = re.sub(r"^\s*(Figure|Page|Table)\s*\d+\s*$", "", text, flags=re.MULTILINE)
-    text = re.sub(r"[^\w\s]", " ", text)
-    text = re.sub(r"\s+", " ", text).strip()
-    return text
+    # Every line-removal pattern needs a digit, so pages without one skip them
+    if DIGIT_PATTERN.search(text):
+        text = PAGE_OF_PATTERN.sub("", text)
+        text = PAGE_RANGE_PATTERN.sub("", text)
+        text = PAGE_NUMBER_PATTERN.sub("", text)
+        text = CAPTION_PATTERN.sub("", text)
+    return SEPARATOR_PATTERN.sub(" ", text).strip()
+
+def _clean_slice(texts):
+    return [clean_text(text) for text in texts]
+
+def clean_many(texts, pool=None, min_parallel=64, slices_per_worker=4):
+    """
+    Cleans a batch of page texts, in order. With a process WorkerPool and enough
+    pages, contiguous slices are cleaned on multiple cores.
+    """
+    texts = list(texts)
+    if pool is None or len(texts) < min_parallel:
+        return _clean_slice(texts)
+    slice_size = max(1, math.ceil(len(texts) / (pool.max_workers * slices_per_worker)))
+    futures = [pool.submit(_clean_slice, texts[i:i + slice_size]) for i in range(0, len(texts), slice_size)]
+    cleaned = []
+    for future in futures:
+        cleaned.extend(future.result())
+    return cleaned
+
+def normalize_query(text):
+    """
+    Normalizes a user question for use as a cache key.
+    """
+    return re.sub(r"\s+", " ", text).strip().lower()
 
 def handle_ocr_errors(text):
     """
@@ -33,19 +70,21 @@ def handle_ocr_errors(text):
     return corrected_text    
 
 def extract_text_by_page(documents):
-    text = ""
+    import langchain_core.documents.base
+
+    parts = []
     for document in documents:
         if isinstance(document, langchain_core.documents.base.Document):  # Validate type
             raw_text = document.page_content
-            print("raw text: ", type(raw_text))  # Debugging info
+            logging.debug(f"raw text: {type(raw_text)}")  # Debugging info
             
             # Clean the text if necessary
             cleaned_text = clean_text(raw_text)
             if cleaned_text:
-                text += cleaned_text
+                parts.append(cleaned_text)
         else:
-            print("Invalid document type:", type(document))
-    return text
+            logging.info(f"Invalid document type: {type(document)}")
+    return "".join(parts)
 
 def extract_text_from_image(pdf_path, page_num):
 
@@ -56,10 +95,10 @@ def extract_text_from_image(pdf_path, page_num):
         pix = page.get_pixmap()
         img_data = pix.tobytes("png")  # Convert to PNG byte data
 
-        ocr_result = reader.readtext(img_data, detail=0)
+        ocr_result = get_reader().readtext(img_data, detail=0)
         text = " ".join(ocr_result)
         text = handle_ocr_errors(text)
         return text 
     except Exception as e:
-        print(f"Error processing page {page_num + 1} with OCR: {e}")
+        logging.warning(f"Error processing page {page_num + 1} with OCR: {e}")
         return ""
\ No newline at end of file
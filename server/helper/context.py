@@ -0,0 +1,132 @@
+import math
+import re
+
+WORD_PATTERN = re.compile(r"\w+")
+
+def estimate_tokens(text):
+    # Rough count for models whose tokenizer is only reachable over the network
+    return math.ceil(len(text) / 4)
+
+def _overlap(left, right, expected, max_search=400):
+    """
+    Length of the suffix of `left` that is also a prefix of `right`. Tries the
+    overlap implied by the chunks' start offsets first, then searches for one.
+    """
+    if 0 < expected <= min(len(left), len(right)) and left[-expected:] == right[:expected]:
+        return expected
+    for size in range(min(len(left), len(right), max_search), 0, -1):
+        if left[-size:] == right[:size]:
+            return size
+    return 0
+
+def merge_adjacent(results):
+    """
+    Merges retrieved chunks that overlap on the same page (split_text uses
+    chunk_overlap=50) into single passages. Returns (rank, text) pairs, where
+    rank is the best retrieval rank among the merged chunks.
+    """
+    spans = []
+    for rank, result in enumerate(results):
+        start = result.metadata.get('start_index')
+        if start is None:
+            spans.append({'key': None, 'start': None, 'end': None, 'rank': rank, 'text': result.page_content})
+            continue
+        spans.append({
+            'key': (result.metadata.get('source'), result.metadata.get('page')),
+            'start': start,
+            'end': start + len(result.page_content),
+            'rank': rank,
+            'text': result.page_content,
+        })
+
+    positioned = sorted((s for s in spans if s['key'] is not None), key=lambda s: (str(s['key']), s['start']))
+    merged = [s for s in spans if s['key'] is None]
+    for span in positioned:
+        previous = merged[-1] if merged and merged[-1]['key'] is not None else None
+        if previous is not None and previous['key'] == span['key'] and span['start'] <= previous['end']:
+            if span['end'] > previous['end']:
+                overlap = _overlap(previous['text'], span['text'], previous['end'] - span['start'])
+                previous['text'] += (" " if overlap == 0 else "") + span['text'][overlap:]
+                previous['end'] = span['end']
+            previous['rank'] = min(previous['rank'], span['rank'])
+            continue
+        merged.append(dict(span))
+    return sorted(((s['rank'], s['text']) for s in merged), key=lambda item: item[0])
+
+def _shingles(text, size=3):
+    words = WORD_PATTERN.findall(text.lower())
+    if len(words) < size:
+        return {tuple(words)}
+    return {tuple(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+def drop_near_duplicates(passages, threshold=0.85):
+    """
+    Drops passages whose word 3-gram Jaccard similarity to an earlier (better
+    ranked) passage is at least `threshold`.
+    """
+    kept = []
+    for rank, text in passages:
+        shingles = _shingles(text)
+        duplicate = False
+        for _, _, other in kept:
+            union = len(shingles | other)
+            if union and len(shingles & other) / union >= threshold:
+                duplicate = True
+                break
+        if not duplicate:
+            kept.append((rank, text, shingles))
+    return [(rank, text) for rank, text, _ in kept]
+
+def mmr_order(passages, passage_vectors, query_vector, diversity=0.3):
+    """
+    Reorders passages by maximal marginal relevance so that later picks favour
+    passages unlike the ones already chosen.
+    """
+    def cosine(a, b):
+        dot = sum(x * y for x, y in zip(a, b))
+        norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+        return dot / norm if norm else 0.0
+
+    relevance = [cosine(vector, query_vector) for vector in passage_vectors]
+    remaining = list(range(len(passages)))
+    chosen = []
+    while remaining:
+        def score(i):
+            redundancy = max((cosine(passage_vectors[i], passage_vectors[j]) for j in chosen), default=0.0)
+            return (1 - diversity) * relevance[i] - diversity * redundancy
+        best = max(remaining, key=score)
+        chosen.append(best)
+        remaining.remove(best)
+    return [passages[i] for i in chosen]
+
+def pack(passages, budget, count_tokens, separator="\n\n"):
+    """
+    Greedily keeps passages in order while they fit in `budget` tokens. If not
+    even the first passage fits, it is cut down to roughly fit.
+    """
+    packed = []
+    used = 0
+    separator_tokens = count_tokens(separator)
+    for _, text in passages:
+        cost = count_tokens(text) + (separator_tokens if packed else 0)
+        if used + cost > budget:
+            continue
+        packed.append(text)
+        used += cost
+    if not packed and passages and budget > 0:
+        text = passages[0][1]
+        ratio = budget / max(1, count_tokens(text))
+        packed.append(text[:int(len(text) * ratio)])
+    return separator.join(packed)
+
+def assemble_context(results, budget, count_tokens, dedup_threshold=0.85,
+                     passage_vectors_fn=None, query_vector=None, diversity=0.3):
+    """
+    Builds the prompt context from retrieved chunks: merge overlapping neighbours,
+    drop near-duplicates, optionally reorder with MMR, then pack into the budget.
+    """
+    passages = merge_adjacent(results)
+    passages = drop_near_duplicates(passages, dedup_threshold)
+    if passage_vectors_fn is not None and query_vector is not None and len(passages) > 1:
+        passages = mmr_order(passages, passage_vectors_fn([text for _, text in passages]), query_vector, diversity)
+    return pack(passages, budget, count_tokens)
@@ -0,0 +1,49 @@
+import math
+import time
+from pypdf import PdfReader
+from server.helper.clean import extract_text_from_image
+
+def extract_page_range(path, start, end, min_chars=20):
+    """
+    Extracts the text of pages [start, end) of a PDF. Pages with fewer than
+    `min_chars` characters of embedded text are treated as scanned and sent to OCR.
+    Runs inside extraction worker processes, so it only returns plain data.
+    """
+    reader = PdfReader(path)
+    pages = []
+    for page_num in range(start, end):
+        started = time.perf_counter()
+        text = reader.pages[page_num].extract_text() or ""
+        ocr = False
+        if len(text.strip()) < min_chars:
+            ocr_text = extract_text_from_image(path, page_num)
+            if len(ocr_text.strip()) > len(text.strip()):
+                text = ocr_text
+                ocr = True
+        pages.append({
+            'page': page_num,
+            'text': text,
+            'ocr': ocr,
+            'seconds': time.perf_counter() - started,
+        })
+    return pages
+
+def extract_pages(path, pool=None, min_chars=20, batches_per_worker=4):
+    """
+    Extracts every page of a PDF, fanning contiguous page ranges out over `pool`
+    (a process WorkerPool) when one is given. Returns page dicts in page order.
+    """
+    num_pages = len(PdfReader(path).pages)
+    if pool is None or num_pages < 2:
+        return extract_page_range(path, 0, num_pages, min_chars)
+
+    # A few ranges per worker keeps workers busy when OCR makes some pages slow
+    batch_size = max(1, math.ceil(num_pages / (pool.max_workers * batches_per_worker)))
+    futures = [
+        pool.submit(extract_page_range, path, start, min(start + batch_size, num_pages), min_chars)
+        for start in range(0, num_pages, batch_size)
+    ]
+    pages = []
+    for future in futures:
+        pages.extend(future.result())
+    return pages
@@ -0,0 +1,111 @@
+import asyncio
+import logging
+import os
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field, asdict
+from typing import Dict, List, Optional
+from server.worker_pool import WorkerPool
+
+STAGES = ['hash', 'load', 'clean', 'split', 'embed', 'store']
+
+@dataclass
+class IngestionJob:
+    filename: str
+    path: str
+    source: str
+    session_id: Optional[str] = None
+    id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    status: str = 'queued'
+    stage: Optional[str] = None
+    error: Optional[str] = None
+    timings: Dict[str, float] = field(default_factory=dict)
+    pages: List[dict] = field(default_factory=list)
+    chunks: Dict[str, int] = field(default_factory=dict)
+    skipped: bool = False
+    created_at: float = field(default_factory=time.time)
+    finished_at: Optional[float] = None
+
+    def progress(self) -> float:
+        if self.status == 'done':
+            return 1.0
+        if self.stage not in STAGES:
+            return 0.0
+        return STAGES.index(self.stage) / len(STAGES)
+
+    def to_dict(self):
+        data = asdict(self)
+        data['progress'] = self.progress()
+        return data
+
+class IngestionQueue:
+    """
+    Runs PDF ingestion as background jobs on a small dedicated pool so uploads
+    return immediately and never compete with chat for agent workers.
+    `notify(snapshot)` is awaited on the event loop with a copy of the job
+    after every state change. Status, errors and timings are also recorded in
+    the agent's document catalog.
+    """
+    def __init__(self, agent, pool: WorkerPool, notify=None, max_jobs=1000, on_failure=None):
+        self.agent = agent
+        self.pool = pool
+        self.notify = notify
+        self.max_jobs = max_jobs
+        self.on_failure = on_failure
+        self.jobs = OrderedDict()
+        self._loop = None
+
+    async def submit(self, filename, path, source, session_id=None) -> IngestionJob:
+        self._loop = asyncio.get_running_loop()
+        job = IngestionJob(filename=filename, path=path, source=source, session_id=session_id)
+        catalog = self.agent.catalog
+        # Recorded before the job can start, so 'queued' never overwrites 'running'.
+        # Off the event loop: the catalog write lock may be held by another worker
+        await asyncio.to_thread(catalog.upsert, filename, source, size=os.path.getsize(path),
+                                status='queued', error=None, job_id=job.id)
+        try:
+            # Raises PoolBusyError when the ingestion queue is full
+            self.pool.submit(self._run, job)
+        except Exception as e:
+            await asyncio.to_thread(catalog.update, filename, status='failed', error=str(e))
+            raise
+        self.jobs[job.id] = job
+        while len(self.jobs) > self.max_jobs:
+            self.jobs.popitem(last=False)
+        return job
+
+    def get(self, job_id) -> Optional[IngestionJob]:
+        return self.jobs.get(job_id)
+
+    def _run(self, job: IngestionJob):
+        job.status = 'running'
+        self.agent.catalog.update(job.filename, status='running')
+
+        def progress(stage):
+            job.stage = stage
+            self._publish(job)
+
+        try:
+            report = self.agent.load_single_document(job.source, progress=progress)
+            job.timings = report['stages']
+            job.pages = report['pages']
+            job.chunks = report['chunks']
+            job.skipped = report['skipped']
+            job.status = 'done'
+            self.agent.catalog.update(job.filename, timings=job.timings)
+        except Exception as e:
+            logging.info(f"Ingestion of {job.filename} failed: {e}")
+            job.status = 'failed'
+            job.error = str(e)
+            self.agent.catalog.update(job.filename, status='failed', error=job.error)
+            if self.on_failure is not None:
+                self.on_failure(job)
+        job.finished_at = time.time()
+        self._publish(job)
+
+    def _publish(self, job: IngestionJob):
+        if self.notify is None or self._loop is None:
+            return
+        # Called from worker threads as well as the event loop; snapshot now, send later
+        asyncio.run_coroutine_threadsafe(self.notify(job.to_dict()), self._loop)
@@ -0,0 +1,92 @@
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+
+def model_size_bytes(model):
+    # Remote models (Gemini) hold no weights locally
+    parameters = getattr(model, 'parameters', None)
+    if not callable(parameters):
+        return 0
+    return sum(p.numel() * p.element_size() for p in parameters())
+
+class ModelRegistry:
+    """
+    Keeps loaded models resident so switching between them is instant.
+    Models load on a background thread; resident models are evicted least
+    recently used first once their combined size exceeds `memory_budget_mb`.
+    Pinned models (the active one) are never evicted. Requests that already hold
+    a reference to an evicted model keep using it until they finish.
+    """
+    def __init__(self, loaders, memory_budget_mb=4096, on_evict=None):
+        self.loaders = loaders
+        self.memory_budget = memory_budget_mb * 1024 * 1024
+        self.on_evict = on_evict
+        self.pinned = set()
+        self.loads = 0
+        self.evictions = 0
+        self._resident = OrderedDict()
+        self._loading = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='model-loader')
+
+    def load(self, name) -> Future:
+        """
+        Returns a future for the model; already resident models resolve immediately.
+        """
+        if name not in self.loaders:
+            raise ValueError(f"Unknown model type: {name}")
+        with self._lock:
+            if name in self._resident:
+                self._resident.move_to_end(name)
+                future = Future()
+                future.set_result(self._resident[name][0])
+                return future
+            if name not in self._loading:
+                self._loading[name] = self._executor.submit(self._load, name)
+            return self._loading[name]
+
+    def _load(self, name):
+        try:
+            model = self.loaders[name]()
+            with self._lock:
+                self._resident[name] = (model, model_size_bytes(model))
+                self.loads += 1
+                evicted = self._evict(keep=name)
+        finally:
+            with self._lock:
+                self._loading.pop(name, None)
+        for evicted_name, evicted_model in evicted:
+            if self.on_evict is not None:
+                self.on_evict(evicted_name, evicted_model)
+        return model
+
+    def _evict(self, keep):
+        evicted = []
+        for name in list(self._resident):
+            if self._resident_bytes() <= self.memory_budget:
+                break
+            # Weightless (remote) models cost nothing to keep
+            if name == keep or name in self.pinned or self._resident[name][1] == 0:
+                continue
+            model, _ = self._resident.pop(name)
+            self.evictions += 1
+            evicted.append((name, model))
+        return evicted
+
+    def _resident_bytes(self):
+        return sum(size for _, size in self._resident.values())
+
+    def pin(self, name):
+        with self._lock:
+            self.pinned = {name}
+
+    def stats(self):
+        with self._lock:
+            return {
+                'resident': {name: size for name, (_, size) in self._resident.items()},
+                'resident_mb': self._resident_bytes() / (1024 * 1024),
+                'memory_budget_mb': self.memory_budget / (1024 * 1024),
+                'loading': list(self._loading),
+                'loads': self.loads,
+                'evictions': self.evictions,
+            }
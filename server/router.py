@@ -0,0 +1,96 @@
+import re
+import threading
+from collections import OrderedDict
+from server.helper.clean import normalize_query
+
+# (pattern, weight) rules; scores are summed per action and capped at 1.0
+GENERATE_VERBS = r"(generate|create|make|build|spawn|render|place|add|show)"
+# "Can you make a chair?" is a request, not a question about the manuals
+POLITE_REQUEST = rf"(can|could|would|will)\s+you\s+(please\s+)?{GENERATE_VERBS}\b"
+
+GENERATE_RULES = [
+    (re.compile(rf"\b{GENERATE_VERBS}\b.*\b(3d|model|object|mesh|asset|prop)s?\b"), 0.8),
+    (re.compile(r"^\s*(please\s+)?(generate|create|spawn|build|make|render)\b"), 0.5),
+    (re.compile(rf"^\s*(please\s+)?{POLITE_REQUEST}"), 0.6),
+    (re.compile(r"\b(3d|mesh|asset|prop)s?\b"), 0.2),
+]
+
+ANSWER_RULES = [
+    (re.compile(r"^\s*(what|how|why|when|where|which|who|whose|does|do|did|is|are|was|were|should|explain|describe|tell)\b"), 0.6),
+    (re.compile(rf"^\s*(?!(please\s+)?{POLITE_REQUEST})(please\s+)?(can|could|would|will)\b"), 0.6),
+    (re.compile(r"\?\s*$"), 0.4),
+    (re.compile(r"\b(manual|document|documentation|page|section|error|configure|setting|support)s?\b"), 0.2),
+]
+
+class ActionRouter:
+    """
+    Decides between 'answer' and 'generate' without a network call.
+    Keyword rules run first; when they are inconclusive the question is compared
+    against the 3D object descriptions, and only if that is still inconclusive is
+    the optional LLM fallback consulted. Decisions are cached by normalized query
+    and by `cache_context_fn()` (e.g. the active model and the asset index version),
+    since the similarity and LLM steps depend on both. The 'default' outcome is
+    not cached: it only means nothing could decide, which may change.
+    """
+    def __init__(self, similarity_fn=None, llm_fallback=None, confidence_threshold=0.3,
+                 similarity_threshold=0.75, cache_size=2048, cache_context_fn=None):
+        self.similarity_fn = similarity_fn
+        self.llm_fallback = llm_fallback
+        self.cache_context_fn = cache_context_fn
+        self.confidence_threshold = confidence_threshold
+        self.similarity_threshold = similarity_threshold
+        self.cache_size = cache_size
+        self.counts = {'cache': 0, 'rules': 0, 'similarity': 0, 'llm': 0, 'default': 0}
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _score(self, rules, text):
+        return min(1.0, sum(weight for pattern, weight in rules if pattern.search(text)))
+
+    def route(self, question, similarity_fn=None):
+        """
+        `similarity_fn` overrides the router's own, e.g. with a score that is
+        already being computed elsewhere.
+        """
+        text = normalize_query(question or "")
+        key = (self.cache_context_fn() if self.cache_context_fn is not None else None, text)
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                self.counts['cache'] += 1
+                return self._cache[key]
+
+        decision, source = self._decide(text, similarity_fn or self.similarity_fn)
+
+        with self._lock:
+            self.counts[source] += 1
+            if source != 'default':
+                self._cache[key] = decision
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return decision
+
+    def _decide(self, text, similarity_fn):
+        generate_score = self._score(GENERATE_RULES, text)
+        answer_score = self._score(ANSWER_RULES, text)
+        if abs(generate_score - answer_score) >= self.confidence_threshold:
+            return ('generate' if generate_score > answer_score else 'answer'), 'rules'
+
+        if similarity_fn is not None:
+            similarity = similarity_fn(text)
+            # A close match to a known 3D asset only counts when nothing reads as a question
+            if similarity >= self.similarity_threshold and answer_score < 0.6:
+                return 'generate', 'similarity'
+            if generate_score == 0 and similarity < self.similarity_threshold:
+                return 'answer', 'similarity'
+
+        if self.llm_fallback is not None:
+            decision = self.llm_fallback(text)
+            if decision is not None:
+                return decision, 'llm'
+
+        return 'answer', 'default'
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counts, cached_decisions=len(self._cache))
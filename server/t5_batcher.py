@@ -0,0 +1,107 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+class T5Batcher:
+    """
+    Dynamic micro-batching for local T5 inference. Requests that arrive within
+    `window_ms` of the first one (up to `max_batch_size`) share a single padded
+    tokenizer call and a single generate() call on a dedicated thread.
+    """
+    def __init__(self, model, tokenizer, window_ms=10, max_batch_size=8,
+                 max_input_length=1024, generate_kwargs=None):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.window = window_ms / 1000
+        self.max_batch_size = max_batch_size
+        self.max_input_length = max_input_length
+        self.generate_kwargs = generate_kwargs or {'max_length': 50, 'num_beams': 4, 'early_stopping': True}
+        self.batches = 0
+        self.requests = 0
+        self.last_batch_size = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._closed = False
+        self._worker = threading.Thread(target=self._run, daemon=True)
+        self._worker.start()
+
+    def generate(self, input_text):
+        future = Future()
+        with self._lock:
+            if self._closed:
+                # A caller that grabbed this batcher before it was retired still gets an answer
+                return self._generate_batch([input_text])[0]
+            self._queue.put((input_text, future, time.perf_counter()))
+        return future.result()
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            self._queue.put(None)
+
+    def _collect(self):
+        first = self._queue.get()
+        if first is None:
+            return None
+        batch = [first]
+        deadline = time.perf_counter() + self.window
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                # Finish this batch, then stop
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            if batch is None:
+                return
+            started = time.perf_counter()
+            waits = [started - enqueued for _, _, enqueued in batch]
+            with self._lock:
+                self.batches += 1
+                self.requests += len(batch)
+                self.last_batch_size = len(batch)
+                self.total_wait += sum(waits)
+                self.max_wait = max(self.max_wait, *waits)
+            try:
+                answers = self._generate_batch([text for text, _, _ in batch])
+            except Exception as e:
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future, _), answer in zip(batch, answers):
+                future.set_result(answer)
+
+    def _generate_batch(self, texts):
+        import torch
+
+        inputs = self.tokenizer(texts, return_tensors="pt", max_length=self.max_input_length,
+                                truncation=True, padding=True)
+        with torch.no_grad():
+            outputs = self.model.generate(inputs["input_ids"], attention_mask=inputs["attention_mask"],
+                                          **self.generate_kwargs)
+        return self.tokenizer.batch_decode(outputs, skip_special_tokens=True)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'batches': self.batches,
+                'requests': self.requests,
+                'last_batch_size': self.last_batch_size,
+                'avg_batch_size': self.requests / self.batches if self.batches else 0.0,
+                'avg_queue_wait_ms': self.total_wait / self.requests * 1000 if self.requests else 0.0,
+                'max_queue_wait_ms': self.max_wait * 1000,
+            }
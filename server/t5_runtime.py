@@ -0,0 +1,122 @@
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+# generate() settings; full_beam is what the server always used before profiles existed
+DECODING_PRESETS = {
+    'greedy': {'max_length': 50, 'num_beams': 1},
+    'small_beam': {'max_length': 50, 'num_beams': 2, 'early_stopping': True},
+    'full_beam': {'max_length': 50, 'num_beams': 4, 'early_stopping': True},
+}
+
+class T5Profile:
+    """
+    How the local T5 model runs on CPU: the runtime (plain torch, or ONNX
+    Runtime through optimum), dynamic int8 quantization of the linear layers,
+    the number of intra-op threads the model may use, and the decoding preset.
+
+    The defaults (torch, no quantization, full beam, sentencepiece tokenizer)
+    reproduce the original answers. The fast tokenizer is opt-in until
+    bench_t5.py shows it matches on the deployed model. The thread budget
+    defaults to half the cores, so inference leaves room for uvicorn, the
+    embedding calls and ingestion.
+    """
+    def __init__(self, runtime='torch', quantize=None, threads=None, decoding='full_beam',
+                 fast_tokenizer=False, onnx_dir='./t5_onnx'):
+        if runtime not in ('torch', 'onnx'):
+            raise ValueError(f"Unsupported T5 runtime: {runtime}")
+        if quantize not in (None, 'int8'):
+            raise ValueError(f"Unsupported T5 quantization: {quantize}")
+        if decoding not in DECODING_PRESETS:
+            raise ValueError(f"Unknown decoding preset: {decoding}")
+        self.runtime = runtime
+        self.quantize = quantize
+        self.threads = threads or max(1, (os.cpu_count() or 2) // 2)
+        self.decoding = decoding
+        self.fast_tokenizer = fast_tokenizer
+        self.onnx_dir = onnx_dir
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            runtime=os.getenv("T5_RUNTIME", "torch"),
+            quantize=os.getenv("T5_QUANTIZE") or None,
+            threads=int(os.getenv("T5_THREADS", 0)) or None,
+            decoding=os.getenv("T5_DECODING", "full_beam"),
+            fast_tokenizer=os.getenv("T5_FAST_TOKENIZER", "0") == "1",
+            onnx_dir=os.getenv("T5_ONNX_DIR", "./t5_onnx"),
+        )
+
+    @property
+    def generate_kwargs(self):
+        return dict(DECODING_PRESETS[self.decoding])
+
+    @property
+    def stream_kwargs(self):
+        # Streaming in transformers only supports greedy/sampling decoding, not beam search
+        return {'max_length': DECODING_PRESETS[self.decoding]['max_length'], 'num_beams': 1}
+
+    def load_tokenizer(self, name):
+        if self.fast_tokenizer:
+            # Rust tokenizer, several times faster on 1024-token contexts.
+            # Check its answers with bench_t5.py before enabling it.
+            from transformers import T5TokenizerFast
+            return T5TokenizerFast.from_pretrained(name)
+        from transformers import T5Tokenizer
+        return T5Tokenizer.from_pretrained(name)
+
+    def load_model(self, name):
+        if self.runtime == 'onnx':
+            try:
+                return self._load_onnx(name)
+            except ImportError:
+                logger.warning("T5_RUNTIME=onnx needs optimum[onnxruntime]; falling back to torch")
+        return self._load_torch(name)
+
+    def _load_torch(self, name):
+        import torch
+        from transformers import T5ForConditionalGeneration
+
+        torch.set_num_threads(self.threads)
+        model = T5ForConditionalGeneration.from_pretrained(name)
+        model.eval()
+        if self.quantize == 'int8':
+            # Weights stored as int8, activations quantized on the fly; only nn.Linear is affected
+            model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        return model
+
+    def _load_onnx(self, name):
+        import onnxruntime
+        from optimum.onnxruntime import ORTModelForSeq2SeqLM
+
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = self.threads
+        options.inter_op_num_threads = 1
+
+        path = os.path.join(self.onnx_dir, name + ('-int8' if self.quantize == 'int8' else ''))
+        if not os.path.isdir(path):
+            # Export once; later starts load the saved graphs
+            logger.info("Exporting %s to ONNX in %s", name, path)
+            model = ORTModelForSeq2SeqLM.from_pretrained(name, export=True)
+            model.save_pretrained(path)
+            if self.quantize == 'int8':
+                self._quantize_onnx(path)
+        return ORTModelForSeq2SeqLM.from_pretrained(path, session_options=options)
+
+    def _quantize_onnx(self, path):
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        for file_name in os.listdir(path):
+            if file_name.endswith('.onnx'):
+                model_path = os.path.join(path, file_name)
+                quantize_dynamic(model_path, model_path, weight_type=QuantType.QInt8)
+
+    def stats(self):
+        return {
+            'runtime': self.runtime,
+            'quantize': self.quantize,
+            'threads': self.threads,
+            'decoding': self.decoding,
+            'fast_tokenizer': self.fast_tokenizer,
+        }
@@ -0,0 +1,196 @@
+import hashlib
+import os
+import struct
+import threading
+import time
+import uuid
+from server import metrics
+
+# Binary chunk frame: magic, upload ID (16 raw UUID bytes), byte offset (big-endian u64), then the data
+CHUNK_MAGIC = b"GCU1"
+CHUNK_HEADER = struct.Struct(">4s16sQ")
+
+UPLOAD_BYTES = metrics.REGISTRY.counter('chatbot_upload_bytes_total', 'Bytes received in binary upload chunks.')
+
+class UploadError(Exception):
+    pass
+
+def parse_chunk(frame):
+    """
+    Splits a binary frame into (upload_id, offset, data) without copying the data.
+    """
+    if len(frame) < CHUNK_HEADER.size:
+        raise UploadError("Chunk frame is shorter than its header")
+    magic, raw_id, offset = CHUNK_HEADER.unpack_from(frame)
+    if magic != CHUNK_MAGIC:
+        raise UploadError("Unknown binary frame")
+    return uuid.UUID(bytes=raw_id).hex, offset, memoryview(frame)[CHUNK_HEADER.size:]
+
+class Upload:
+    """
+    One file being received. Chunks are written at their offset in a preallocated
+    temp file, so memory use does not depend on the file size and chunks may
+    arrive in any order or more than once; `ranges` holds the merged [start, end)
+    byte ranges received so far.
+    """
+    def __init__(self, upload_id, name, total_size, temp_path, sha256=None, session_id=None):
+        self.id = upload_id
+        self.name = name
+        self.total_size = total_size
+        self.temp_path = temp_path
+        self.sha256 = sha256
+        self.session_id = session_id
+        self.ranges = []
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+        with open(temp_path, 'wb') as f:
+            f.truncate(total_size)
+
+    def write(self, offset, data):
+        if offset + len(data) > self.total_size:
+            raise UploadError(f"Chunk at offset {offset} runs past the declared size of {self.total_size} bytes")
+        with self._lock:
+            with open(self.temp_path, 'r+b') as f:
+                f.seek(offset)
+                f.write(data)
+            self._add_range(offset, offset + len(data))
+            self.updated_at = time.monotonic()
+
+    def _add_range(self, start, end):
+        merged = []
+        for range_start, range_end in self.ranges:
+            if range_end < start or range_start > end:
+                merged.append([range_start, range_end])
+            else:
+                start, end = min(start, range_start), max(end, range_end)
+        merged.append([start, end])
+        merged.sort()
+        self.ranges = merged
+
+    def received(self):
+        with self._lock:
+            return [list(r) for r in self.ranges]
+
+    def bytes_received(self):
+        with self._lock:
+            return sum(end - start for start, end in self.ranges)
+
+    def is_complete(self):
+        with self._lock:
+            return self.ranges == [[0, self.total_size]] or self.total_size == 0
+
+    def verify(self):
+        if self.sha256 is None:
+            return
+        digest = hashlib.sha256()
+        with open(self.temp_path, 'rb') as f:
+            while block := f.read(1024 * 1024):
+                digest.update(block)
+        if digest.hexdigest() != self.sha256.lower():
+            raise UploadError("Checksum mismatch, the file was corrupted in transit")
+
+    def status(self):
+        return {
+            "upload_id": self.id,
+            "name": self.name,
+            "total_size": self.total_size,
+            "bytes_received": self.bytes_received(),
+            "received": self.received(),
+        }
+
+class UploadManager:
+    """
+    Resumable uploads over the WebSocket. Uploads outlive the connection that
+    started them, so a client that reconnects can ask which ranges arrived and
+    send only the rest. Idle uploads are discarded after `ttl` seconds.
+    """
+    def __init__(self, temp_dir, max_size=512 * 1024 * 1024, ttl=3600):
+        self.temp_dir = temp_dir
+        self.max_size = max_size
+        self.ttl = ttl
+        self.uploads = {}
+        self._lock = threading.Lock()
+        os.makedirs(temp_dir, exist_ok=True)
+
+    def start(self, name, total_size, sha256=None, session_id=None, upload_id=None) -> Upload:
+        """
+        Starts a new upload, or resumes `upload_id` if it is still known.
+        """
+        self.expire()
+        if upload_id is not None:
+            upload = self.get(upload_id)
+            if upload is not None:
+                upload.session_id = session_id
+                return upload
+
+        name = os.path.basename(name or "")
+        if not name:
+            raise UploadError("A file name is required")
+        if name in ('.', '..') or not name.lower().endswith('.pdf'):
+            raise UploadError("Only .pdf files can be uploaded")
+        if not isinstance(total_size, int) or total_size < 0:
+            raise UploadError("total_size must be a non-negative integer")
+        if total_size > self.max_size:
+            raise UploadError(f"File is larger than the {self.max_size} byte limit")
+
+        upload_id = uuid.uuid4().hex
+        upload = Upload(upload_id, name, total_size, os.path.join(self.temp_dir, f"{upload_id}.part"),
+                        sha256=sha256, session_id=session_id)
+        with self._lock:
+            self.uploads[upload_id] = upload
+        return upload
+
+    def get(self, upload_id):
+        with self._lock:
+            return self.uploads.get(upload_id)
+
+    def write_chunk(self, frame) -> Upload:
+        upload_id, offset, data = parse_chunk(frame)
+        upload = self.get(upload_id)
+        if upload is None:
+            raise UploadError(f"Unknown upload {upload_id}")
+        upload.write(offset, data)
+        UPLOAD_BYTES.inc(len(data))
+        return upload
+
+    def finish(self, upload, destination):
+        """
+        Verifies a complete upload and moves it to `destination`. Returns False if
+        another connection already finished it. The temp file is removed if either
+        step fails, since the upload is no longer tracked for expiry.
+        """
+        with self._lock:
+            if self.uploads.pop(upload.id, None) is None:
+                return False
+        try:
+            upload.verify()
+        except UploadError:
+            self._remove(upload.temp_path)
+            raise
+        try:
+            os.replace(upload.temp_path, destination)
+        except OSError as e:
+            self._remove(upload.temp_path)
+            raise UploadError(f"Could not store {upload.name}: {e.strerror or e}")
+        return True
+
+    def cancel(self, upload_id):
+        with self._lock:
+            upload = self.uploads.pop(upload_id, None)
+        if upload is not None:
+            self._remove(upload.temp_path)
+
+    def expire(self):
+        now = time.monotonic()
+        with self._lock:
+            expired = [upload for upload in self.uploads.values() if now - upload.updated_at > self.ttl]
+            for upload in expired:
+                del self.uploads[upload.id]
+        for upload in expired:
+            self._remove(upload.temp_path)
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
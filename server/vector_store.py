@@ -0,0 +1,51 @@
+import threading
+
+class CollectionRegistry:
+    """
+    Long-lived Chroma handles and retrievers keyed by (collection name, persistence mode).
+    Handles are opened once and shared by all requests. Writes go through the same
+    handles, so queries see them without reopening; refresh() is only needed if
+    the collection was changed by another client.
+    """
+    def __init__(self, embedding_function, persist_directory):
+        self.embedding_function = embedding_function
+        self.persist_directory = persist_directory
+        self._handles = {}
+        self._lock = threading.Lock()
+
+    def _open(self, collection_name, persistant):
+        from langchain_community.vectorstores import Chroma
+
+        if persistant:
+            db = Chroma(collection_name=collection_name,
+                        embedding_function=self.embedding_function,
+                        persist_directory=self.persist_directory)
+        else:
+            db = Chroma(collection_name=collection_name,
+                        embedding_function=self.embedding_function)
+        return db, db.as_retriever()
+
+    def _entry(self, collection_name, persistant):
+        key = (collection_name, persistant)
+        entry = self._handles.get(key)
+        if entry is None:
+            with self._lock:
+                entry = self._handles.get(key)
+                if entry is None:
+                    entry = self._open(collection_name, persistant)
+                    self._handles[key] = entry
+        return entry
+
+    def get(self, collection_name, persistant=True):
+        return self._entry(collection_name, persistant)[0]
+
+    def retriever(self, collection_name, persistant=True):
+        return self._entry(collection_name, persistant)[1]
+
+    def register(self, collection_name, db, persistant=True):
+        with self._lock:
+            self._handles[(collection_name, persistant)] = (db, db.as_retriever())
+
+    def refresh(self, collection_name, persistant=True):
+        with self._lock:
+            self._handles.pop((collection_name, persistant), None)
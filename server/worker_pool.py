@@ -0,0 +1,113 @@
+import asyncio
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+class PoolBusyError(Exception):
+    pass
+
+class WorkerPool:
+    """
+    Bounded executor for blocking agent work (LLM calls, Chroma queries, T5 generate).
+    At most `max_workers` jobs run at once and at most `max_queue` more may wait;
+    anything beyond that is rejected immediately with PoolBusyError.
+    Process pools start their workers with `start_method` ('spawn' by default):
+    forking a server that already runs threads (uvicorn, model loading, torch's
+    OpenMP pool) can leave the child deadlocked on a lock one of them held.
+    """
+    def __init__(self, kind='thread', max_workers=4, max_queue=16, initializer=None, start_method='spawn'):
+        if kind not in ('thread', 'process'):
+            raise ValueError(f"Unsupported pool kind: {kind}")
+        self.kind = kind
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.initializer = initializer
+        self.start_method = start_method
+        self.pending = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+        self._executor = None
+
+    @classmethod
+    def from_env(cls, prefix, kind='thread', max_workers=4, max_queue=16):
+        return cls(
+            kind=kind,
+            max_workers=int(os.getenv(f"{prefix}_POOL_WORKERS", max_workers)),
+            max_queue=int(os.getenv(f"{prefix}_POOL_QUEUE", max_queue)),
+        )
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            if self.kind == 'process':
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers, initializer=self.initializer,
+                                                     mp_context=multiprocessing.get_context(self.start_method))
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, initializer=self.initializer)
+        return self._executor
+
+    def submit(self, fn, *args, **kwargs):
+        # Admission control: running + waiting jobs may not exceed workers + queue
+        with self._lock:
+            if self.pending >= self.max_workers + self.max_queue:
+                self.rejected += 1
+                raise PoolBusyError("Server is busy, please try again shortly.")
+            self.pending += 1
+        try:
+            future = self.executor.submit(fn, *args, **kwargs)
+        except Exception:
+            self._release(None)
+            raise
+        future.add_done_callback(self._release)
+        return future
+
+    async def run(self, fn, *args, **kwargs):
+        return await asyncio.wrap_future(self.submit(fn, *args, **kwargs))
+
+    async def iterate(self, fn, *args, **kwargs):
+        """
+        Run a blocking generator on the pool and yield its items on the event loop
+        as they are produced. Closing the async iterator stops the generator early.
+        """
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+        done = object()
+        stopped = threading.Event()
+
+        def produce():
+            generator = fn(*args, **kwargs)
+            try:
+                for item in generator:
+                    if stopped.is_set():
+                        break
+                    loop.call_soon_threadsafe(queue.put_nowait, item)
+            finally:
+                generator.close()
+                loop.call_soon_threadsafe(queue.put_nowait, done)
+
+        future = self.submit(produce)
+        try:
+            while True:
+                item = await queue.get()
+                if item is done:
+                    break
+                yield item
+            # Surface any exception raised by the generator
+            await asyncio.wrap_future(future)
+        finally:
+            stopped.set()
+            # Still queued: drop it instead of running it for nobody
+            future.cancel()
+
+    def _release(self, _future):
+        with self._lock:
+            self.pending -= 1
+
+    def queue_depth(self):
+        return max(0, self.pending - self.max_workers)
+
+    def shutdown(self, wait=True):
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait, cancel_futures=True)
+            self._executor = None
@@ -0,0 +1,55 @@
+import math
+import os
+import sys
+import time
+import zlib
+
+import pytest
+from langchain_core.embeddings import Embeddings
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+class HashEmbeddings(Embeddings):
+    # Offline bag-of-words embeddings (feature hashing)
+    def __init__(self, dim=64):
+        self.dim = dim
+
+    def _vector(self, text):
+        vector = [0.0] * self.dim
+        for word in text.lower().split():
+            digest = zlib.crc32(word.encode('utf-8'))
+            vector[digest % self.dim] += 1.0 if digest & 0x80000000 else -1.0
+        norm = math.sqrt(sum(x * x for x in vector)) or 1.0
+        return [x / norm for x in vector]
+
+    def embed_documents(self, texts):
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text):
+        return self._vector(text)
+
+class SlowChatModel:
+    # Stands in for the Gemini chat model; only its load time matters here
+    loads = 0
+
+    def __init__(self, load_seconds):
+        time.sleep(load_seconds)
+        SlowChatModel.loads += 1
+
+@pytest.fixture
+def make_agent(tmp_path, monkeypatch):
+    """
+    Builds an offline Gemini-mode AIAgent whose relative paths (./public,
+    ./chroma, the catalog and caches) live in a temporary directory.
+    """
+    from server.ai_agent import AIAgent
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("CATALOG_PATH", str(tmp_path / 'catalog.sqlite3'))
+    (tmp_path / 'public').mkdir()
+    SlowChatModel.loads = 0
+
+    def make(load_seconds=0.0):
+        return AIAgent('gemini', embeddings=HashEmbeddings(), embedding_model='hash-64',
+                       chat_model=lambda: SlowChatModel(load_seconds))
+    return make
@@ -0,0 +1,42 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from conftest import SlowChatModel
+
+def test_concurrent_first_requests_share_one_load(make_agent):
+    agent = make_agent(load_seconds=0.5)
+    with ThreadPoolExecutor(3) as pool:
+        results = list(pool.map(lambda _: agent._ensure_model(), range(3)))
+
+    assert SlowChatModel.loads == 1
+    assert all(model_type == 'gemini' and model is not None for model_type, model, _ in results)
+    assert len({id(model) for _, model, _ in results}) == 1
+
+def test_request_during_warm_up_does_not_break_readiness(make_agent):
+    agent = make_agent(load_seconds=0.5)
+    errors = []
+
+    def warm_up():
+        try:
+            agent.warm_up()
+        except Exception as e:
+            errors.append(e)
+
+    warming = threading.Thread(target=warm_up)
+    warming.start()
+    # A chat arriving during startup loads the model on first use
+    model_type, model, _ = agent._ensure_model()
+    warming.join()
+
+    assert errors == []
+    assert model_type == 'gemini' and model is not None
+    assert agent.readiness()['ready']
+    assert SlowChatModel.loads == 1
+
+def test_explicit_switch_wins_over_first_use_load(make_agent):
+    agent = make_agent(load_seconds=0.5)
+    with ThreadPoolExecutor(1) as pool:
+        first_use = pool.submit(agent._ensure_model)
+        switched = agent.switch_model('gemini')
+        assert switched.result(timeout=5) == 'gemini'
+        assert first_use.result(timeout=5)[1] is not None
@@ -0,0 +1,53 @@
+import pytest
+
+from server.router import ActionRouter
+
+POLITE_REQUESTS = [
+    "Can you make a chair?",
+    "Could you create a table for me?",
+    "Would you please build a lamp?",
+    "Will you render a workbench?",
+    "Please can you spawn a crate?",
+]
+
+@pytest.mark.parametrize("question", POLITE_REQUESTS)
+def test_polite_generate_request_is_not_decided_by_rules(question):
+    asked = []
+
+    def llm(text):
+        asked.append(text)
+        return 'generate'
+
+    router = ActionRouter(similarity_fn=lambda text: 0.0, llm_fallback=llm)
+    assert router.route(question) == 'generate'
+    assert asked == [question.lower()]
+    assert router.stats()['rules'] == 0
+
+@pytest.mark.parametrize("question", POLITE_REQUESTS)
+def test_polite_generate_request_matching_an_asset(question):
+    router = ActionRouter(similarity_fn=lambda text: 0.9)
+    assert router.route(question) == 'generate'
+    assert router.stats()['similarity'] == 1
+
+@pytest.mark.parametrize("question, decision", [
+    ("Can you make a 3d model of a chair?", 'generate'),
+    ("generate a chair", 'generate'),
+    ("Can I reset the fault?", 'answer'),
+    ("Could you explain the brake?", 'answer'),
+    ("What voltage does the controller need?", 'answer'),
+])
+def test_rules_still_decide_clear_cases(question, decision):
+    router = ActionRouter(llm_fallback=lambda text: pytest.fail("LLM fallback consulted"))
+    assert router.route(question) == decision
+    assert router.stats()['rules'] == 1
+
+def test_default_decisions_are_not_cached():
+    model = ['t5-base']
+    router = ActionRouter(similarity_fn=lambda text: 0.0,
+                          llm_fallback=lambda text: 'generate' if model[0] == 'gemini' else None,
+                          cache_context_fn=lambda: model[0])
+    assert router.route("Can you make a chair?") == 'answer'
+    model[0] = 'gemini'
+    assert router.route("Can you make a chair?") == 'generate'
+    assert router.route("Can you make a chair?") == 'generate'
+    assert router.stats()['cache'] == 1
@@ -0,0 +1,30 @@
+import os
+import uuid
+
+import pytest
+
+from server.uploads import CHUNK_HEADER, CHUNK_MAGIC, UploadError, UploadManager
+
+def chunk(upload, offset, data):
+    return CHUNK_HEADER.pack(CHUNK_MAGIC, uuid.UUID(upload.id).bytes, offset) + data
+
+@pytest.mark.parametrize("name", ["..", ".", "../..", "notes.txt", "manual"])
+def test_start_rejects_non_pdf_names(tmp_path, name):
+    uploads = UploadManager(str(tmp_path / 'tmp'))
+    with pytest.raises(UploadError):
+        uploads.start(name, 10)
+    assert os.listdir(tmp_path / 'tmp') == []
+
+def test_start_keeps_only_the_base_name(tmp_path):
+    uploads = UploadManager(str(tmp_path / 'tmp'))
+    assert uploads.start("../../etc/Manual.PDF", 10).name == "Manual.PDF"
+
+def test_failed_move_removes_the_temp_file(tmp_path):
+    uploads = UploadManager(str(tmp_path / 'tmp'))
+    upload = uploads.start("manual.pdf", 4)
+    uploads.write_chunk(chunk(upload, 0, b"%PDF"))
+    assert upload.is_complete()
+
+    with pytest.raises(UploadError):
+        uploads.finish(upload, str(tmp_path / 'missing' / 'manual.pdf'))
+    assert os.listdir(tmp_path / 'tmp') == []